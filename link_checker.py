@@ -5,36 +5,118 @@
 """
 
 # Standard library
-from urllib.parse import urljoin, urlsplit
+from collections import deque, namedtuple
+from urllib.parse import urldefrag, urljoin, urlsplit
 import argparse
+import glob
+import hashlib
+import html
+import importlib.util
+import json
 import os
 import posixpath
+import random
+import re
+import socket
 import sys
+import tempfile
 import time
 import traceback
 
-# Third-party
-from bs4 import BeautifulSoup
-from junit_xml import TestCase, TestSuite, to_xml_report_file
-import grequests  # WARNING: Always import grequests before requests
-import requests
+# Third-party dependencies (beautifulsoup4/lxml and grequests/requests) are
+# imported on the code paths that need them to keep the startup fast. See
+# import_network().
 
 
 # Set defaults
-START_TIME = time.time()
 HEADER = {
     "User-Agent": "Mozilla/5.0 (X11; Linux i686 on x86_64; rv:10.0)"
     " Gecko/20100101 Firefox/10.0"
 }
-MEMOIZED_LINKS = {}
-MAP_BROKEN_LINKS = {}
 GOOD_RESPONSE = [200, 300, 301, 302]
 REQUESTS_TIMEOUT = 5
+MAX_CONCURRENT_REQUESTS = 100
+# Outcome replayed for links missing from the cassette file
+NOT_RECORDED = ("Not Recorded", 0.0, "HEAD", 1)
+# Links failing with a transient error are retried RETRIES times by default,
+# waiting a random delay of up to RETRY_BACKOFF * 2 ** (attempt - 1) seconds
+# capped at RETRY_MAX_DELAY
+RETRIES = 2
+RETRY_BACKOFF = 0.5
+RETRY_MAX_DELAY = 8
+# Servers which refuse HEAD requests with these status codes are checked again
+# with a GET request, reading at most GET_FALLBACK_BYTES of the body
+HEAD_FALLBACK_STATUS = [403, 405, 501]
+GET_FALLBACK_BYTES = 1024
+# Host names are resolved once and their addresses (or their absence) cached
+# for DNS_TTL seconds. Links to unknown hosts are reported as UNKNOWN_HOST
+# without connecting.
+DNS_TTL = 300
+# Resolver errors meaning that the host name does not exist (NXDOMAIN or no
+# address). Other errors (ex. EAI_FAIL) are not cached.
+NXDOMAIN_ERRORS = {
+    getattr(socket, name)
+    for name in ("EAI_NONAME", "EAI_NODATA")
+    if hasattr(socket, name)
+}
+UNKNOWN_HOST = "Unknown Host"
+# Outcome of links which cannot be parsed (ex. "http://[bad")
+INVALID_URL = "Invalid URL"
+# With --http2, the HEAD requests to a server are multiplexed on one
+# connection, at most HTTP2_MAX_STREAMS at once (or fewer if the server asks)
+HTTP2_MAX_STREAMS = 100
 GITHUB_BASE = (
     "https://raw.githubusercontent.com/creativecommons/creativecommons.org"
     "/master/docroot/legalcode/"
 )
 LICENSE_LOCAL_PATH = "../creativecommons.org/docroot/legalcode"
+WATCH_INTERVAL = 0.5
+# Number of URLs of the crawl frontier kept in memory before spilling the
+# frontier to disk
+FRONTIER_MEMORY = 100000
+# Number of absolute links memoized by LinkResolver before its memo is
+# cleared
+RESOLVER_MEMORY = 100000
+# junit-xml report written with --output-errors. The attributes of its
+# testsuite tag are padded to a fixed width so the totals can be updated in
+# place after each testcase
+JUNIT_REPORT_PATH = "test-summary/junit-xml-report.xml"
+JUNIT_HEADER_WIDTH = 160
+# Pages with these extensions are checked but not crawled
+NOT_CRAWLED_EXTENSIONS = {
+    ".css",
+    ".gif",
+    ".ico",
+    ".jpeg",
+    ".jpg",
+    ".js",
+    ".json",
+    ".mp3",
+    ".mp4",
+    ".odt",
+    ".pdf",
+    ".png",
+    ".rdf",
+    ".svg",
+    ".txt",
+    ".xml",
+    ".zip",
+}
+# Resource-bearing attributes of tags other than anchors
+RESOURCE_ATTRIBUTES = {
+    "audio": ["src"],
+    "embed": ["src"],
+    "iframe": ["src"],
+    "img": ["src", "srcset"],
+    "link": ["href"],
+    "object": ["data"],
+    "script": ["src"],
+    "source": ["src", "srcset"],
+    "track": ["src"],
+    "video": ["src", "poster"],
+}
+# Resource URLs with these schemes are not fetched over the network
+NOT_FETCHED_SCHEMES = ("about:", "blob:", "data:", "javascript:")
 TEST_ORDER = ["zero", "4.0", "3.0", "2.5", "2.1", "2.0"]
 DEFAULT_ROOT_URL = "https://creativecommons.org"
 CRITICAL = 50
@@ -44,6 +126,21 @@ INFO = 20
 DEBUG = 10
 
 
+# License file of the corpus, as parsed from its file name
+LicenseFile = namedtuple(
+    "LicenseFile",
+    [
+        "name",
+        "license",
+        "version",
+        "jurisdiction",
+        "language",
+        "base_url",
+        "path",
+    ],
+)
+
+
 class CheckerError(Exception):
     def __init__(self, message, code=None):
         self.code = code if code else 1
@@ -62,11 +159,98 @@ def parse_argument(arguments):
     """
     # Setup argument parser
     parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--baseline",
+        help="Compares the broken links found with the results saved by"
+        " --results to baseline_file, and reports the newly broken, still"
+        " broken and fixed links. Only newly broken links make the check"
+        " fail.",
+        metavar="baseline_file",
+    )
+    parser.add_argument(
+        "--crawl",
+        help="Crawls the site breadth-first from the root URL (or from the"
+        " local docroot with --local) instead of checking license files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--deadline",
+        help="Stops checking new license files once SECONDS have elapsed",
+        metavar="SECONDS",
+        type=float,
+    )
+    parser.add_argument(
+        "--exclude",
+        help="Does not crawl pages whose URL matches the regular expression."
+        " Can be specified multiple times.",
+        metavar="PATTERN",
+        action="append",
+    )
+    parser.add_argument(
+        "--history",
+        help="Checks license files which had broken links in previous runs"
+        " first, and records the license files with broken links to"
+        " history_file",
+        metavar="history_file",
+    )
+    parser.add_argument(
+        "--html",
+        help="Checks the HTML files matching the glob pattern instead of"
+        " license files. The base URL of each file is the root URL followed"
+        " by its path relative to the directory of the pattern. Can be"
+        " specified multiple times.",
+        metavar="PATTERN",
+        action="append",
+    )
+    parser.add_argument(
+        "--http2",
+        help="Sends the HEAD requests to HTTPS servers over HTTP/2, on one"
+        " connection per server (requires the h2 package). Servers which do"
+        " not support HTTP/2 are checked with HTTP/1.1.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--include",
+        help="Crawls only pages whose URL matches the regular expression. Can"
+        " be specified multiple times.",
+        metavar="PATTERN",
+        action="append",
+    )
+    parser.add_argument(
+        "--jurisdiction",
+        help="Checks only license files of the jurisdiction (ex. fr). Can be"
+        " specified multiple times.",
+        action="append",
+    )
+    parser.add_argument(
+        "--language",
+        help="Checks only license files in the language (ex. de). Can be"
+        " specified multiple times.",
+        action="append",
+    )
+    parser.add_argument(
+        "--license",
+        help="Checks only license files of the license (ex. by-sa). Can be"
+        " specified multiple times.",
+        action="append",
+    )
     parser.add_argument(
         "--local",
         help="Scrapes license files from local file system",
         action="store_true",
     )
+    parser.add_argument(
+        "--max-depth",
+        help="Crawls pages at most N links away from the root URL",
+        metavar="N",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-errors",
+        help="Stops checking new license files once N broken links are found",
+        metavar="N",
+        type=int,
+    )
     parser.add_argument(
         "--output-errors",
         help="Outputs all link errors to file (default: errorlog.txt) and"
@@ -84,9 +268,36 @@ def parse_argument(arguments):
         dest="verbosity",
         help="Decrease verbosity. Can be specified multiple times.",
     )
+    parser.add_argument(
+        "--retries",
+        help="Number of times links failing with a transient error (timeout,"
+        f" connection reset, 5xx, 429) are retried (default: {RETRIES})",
+        default=RETRIES,
+        type=int,
+    )
     parser.add_argument(
         "--root-url", help=f"Set root URL (default: {DEFAULT_ROOT_URL})",
     )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record",
+        help="Records the outcome of every link check to cassette file",
+        metavar="cassette_file",
+        type=argparse.FileType("w", encoding="utf-8"),
+    )
+    cassette.add_argument(
+        "--replay",
+        help="Replays link check outcomes from cassette file instead of"
+        " making network requests",
+        metavar="cassette_file",
+        type=argparse.FileType("r", encoding="utf-8"),
+    )
+    parser.add_argument(
+        "--results",
+        help="Saves the broken links found, with the files in which they"
+        " were found, to results_file (to be used with --baseline)",
+        metavar="results_file",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -96,7 +307,46 @@ def parse_argument(arguments):
         help="Increase verbosity. Can be specified multiple times.",
     )
 
+    parser.add_argument(
+        "--url-list",
+        help="Checks the URLs listed in url_file, one per line, instead of"
+        " license files. Use - to stream URLs on stdin.",
+        metavar="url_file",
+        type=argparse.FileType("r", encoding="utf-8"),
+    )
+    parser.add_argument(
+        "--version",
+        help="Checks only license files of the version (ex. 4.0). Can be"
+        " specified multiple times.",
+        action="append",
+    )
+    parser.add_argument(
+        "--watch",
+        help="Watches local license files (requires --local) and checks each"
+        " file again when it is modified",
+        action="store_true",
+    )
+
     args = parser.parse_args(arguments)
+    if args.watch and not args.local:
+        parser.error("--watch requires --local")
+    sources = [
+        flag
+        for flag, value in (
+            ("--crawl", args.crawl),
+            ("--html", args.html),
+            ("--url-list", args.url_list),
+        )
+        if value
+    ]
+    if len(sources) > 1:
+        parser.error(
+            "{} cannot be used together".format(" and ".join(sources))
+        )
+    if args.watch and sources:
+        parser.error("--watch cannot be used with {}".format(sources[0]))
+    if args.http2 and importlib.util.find_spec("h2") is None:
+        parser.error("--http2 requires the h2 package (pip install h2)")
     if args.root_url is None:
         args.root_url = DEFAULT_ROOT_URL
     args.log_level = WARNING
@@ -112,6 +362,21 @@ def parse_argument(arguments):
     return args
 
 
+def import_network():
+    """Imports the network stack on first use. grequests monkeypatches the
+    whole interpreter with gevent, so it is only imported once a request is
+    actually made
+
+    Returns:
+        set: grequests - grequests module
+             requests - requests module
+    """
+    import grequests  # WARNING: Always import grequests before requests
+    import requests
+
+    return grequests, requests
+
+
 def get_local_licenses():
     """This function get all the licenses stored locally
 
@@ -127,20 +392,95 @@ def get_local_licenses():
     # Catching permission denied(OS ERROR) or other errors
     except:
         raise
-    # Although license_names_unordered is sorted below, is not ordered
-    # according to TEST_ORDER.
-    license_names_unordered.sort()
-    license_names = []
-    # Test newer licenses first (they are the most volatile) and exclude
-    # non-.html files
-    for version in TEST_ORDER:
-        for name in license_names_unordered:
-            if ".html" in name and version in name:
-                license_names.append(name)
-    for name in license_names_unordered:
-        if ".html" in name and name not in license_names:
-            license_names.append(name)
-    return license_names
+    # Skip hidden files (ex. editor lock and swap files, see --watch)
+    return order_license_names(
+        name for name in license_names_unordered if not name.startswith(".")
+    )
+
+
+def get_html_files(root_url, patterns):
+    """Gets the HTML files matching glob patterns, mapped to the URL on which
+    they are displayed: the root URL followed by the path of the file
+    relative to the directory of the pattern
+
+    Args:
+        root_url (str): Root URL of the site
+        patterns (list): Glob patterns of the HTML files
+
+    Returns:
+        list: Tuples of (path, base URL) of the HTML files
+    """
+    html_files = {}
+    for pattern in patterns:
+        pattern_root = os.path.dirname(pattern)
+        while glob.has_magic(pattern_root):
+            pattern_root = os.path.dirname(pattern_root)
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if path in html_files or not os.path.isfile(path):
+                continue
+            relative_path = os.path.relpath(path, pattern_root or os.curdir)
+            html_files[path] = posixpath.join(
+                root_url, relative_path.replace(os.sep, "/")
+            )
+    if not html_files:
+        raise CheckerError(
+            "No HTML files match the patterns ({})".format(", ".join(patterns))
+        )
+    return list(html_files.items())
+
+
+def read_lines(url_file):
+    """Reads the links listed in a file, one per line, as they arrive. The
+    file is read in a thread so that the checks of the links already read go
+    on while waiting (ex. for stdin).
+
+    Args:
+        url_file (file): File opened for reading
+
+    Yields:
+        str: Link, skipping blank lines and comments (starting with #)
+    """
+    import gevent
+
+    threadpool = gevent.get_hub().threadpool
+    while True:
+        line = threadpool.apply(url_file.readline)
+        if not line:
+            return
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def get_local_mtimes():
+    """Gets modification time of the license files stored locally. Hidden
+    files (ex. editor lock and swap files) and entries which are not regular
+    files are skipped.
+
+    Returns:
+        dict: Modification time in nanoseconds keyed by file name of license
+            file
+    """
+    mtimes = {}
+    try:
+        with os.scandir(LICENSE_LOCAL_PATH) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.name.endswith(
+                    ".html"
+                ):
+                    continue
+                try:
+                    if entry.is_file():
+                        mtimes[entry.name] = entry.stat().st_mtime_ns
+                except OSError:
+                    # Removed since the directory was scanned (ex. replaced
+                    # by an editor saving it)
+                    continue
+    except FileNotFoundError:
+        raise CheckerError(
+            "Local license path({}) does not exist".format(LICENSE_LOCAL_PATH)
+        )
+    return mtimes
 
 
 def get_github_licenses():
@@ -155,23 +495,38 @@ def get_github_licenses():
         "/docroot/legalcode"
     )
     page_text = request_text(URL)
-    soup = BeautifulSoup(page_text, "lxml")
-    license_names_unordered = []
-    for link in soup.find_all("a", class_="js-navigation-open link-gray-dark"):
-        license_names_unordered.append(link.string)
-    # Although license_names_unordered is sorted below, is not ordered
-    # according to TEST_ORDER.
-    license_names_unordered.sort()
-    license_names = []
-    # Test newer licenses first (they are the most volatile) and exclude
-    # non-.html files
-    for version in TEST_ORDER:
-        for name in license_names_unordered:
-            if ".html" in name.string and version in name.string:
-                license_names.append(name)
-    for name in license_names_unordered:
-        if ".html" in name.string and name not in license_names:
-            license_names.append(name)
+    soup = parse_html(page_text)
+    license_names_unordered = [
+        str(link.string)
+        for link in soup.find_all(
+            "a", class_="js-navigation-open link-gray-dark"
+        )
+    ]
+    return order_license_names(license_names_unordered)
+
+
+def order_license_names(license_names_unordered):
+    """Orders license file names according to TEST_ORDER, then by name, and
+    excludes non-.html files
+
+    Args:
+        license_names_unordered (list): File names of license files
+
+    Returns:
+        list: Ordered file names of license files
+    """
+
+    def rank(name):
+        for idx, version in enumerate(TEST_ORDER):
+            if version in name:
+                return idx
+        return len(TEST_ORDER)
+
+    # Test newer licenses first (they are the most volatile)
+    license_names = sorted(
+        name for name in license_names_unordered if name.endswith(".html")
+    )
+    license_names.sort(key=rank)
     return license_names
 
 
@@ -182,8 +537,9 @@ def request_text(page_url):
         page_url (str): URL to perform a GET request for
 
     Returns:
-        str: request response text
+        bytes: request response content
     """
+    _, requests = import_network()
     try:
         r = requests.get(page_url, headers=HEADER, timeout=REQUESTS_TIMEOUT)
         fetched_text = r.content
@@ -204,20 +560,97 @@ def request_text(page_url):
     return fetched_text
 
 
+def request_page(page_url, session=None):
+    """This function makes a requests get for a page to crawl and returns its
+    content if it is an HTML page
+
+    Args:
+        page_url (str): URL to perform a GET request for
+        session (class 'requests.Session'): Session whose connection pool is
+            used for the request
+
+    Returns:
+        set: content - HTML content of the page or None
+             redirect_url - URL the page redirects to or None
+    """
+    _, requests = import_network()
+    if session is None:
+        session = requests
+    try:
+        r = session.get(
+            page_url,
+            headers=HEADER,
+            timeout=REQUESTS_TIMEOUT,
+            stream=True,
+            allow_redirects=False,
+        )
+    except requests.exceptions.RequestException:
+        # Pages are crawled after their link was checked, so the error is
+        # already reported
+        return None, None
+    with r:
+        if r.is_redirect:
+            return None, urljoin(page_url, r.headers["Location"])
+        content_type = r.headers.get("Content-Type", "")
+        if r.status_code != 200 or "html" not in content_type:
+            return None, None
+        return r.content, None
+
+
+def normalize_page_url(url):
+    """Normalizes URL of a page to crawl, so that each page is crawled once
+
+    Args:
+        url (str): Absolute URL of the page
+
+    Returns:
+        str: URL without fragment and with at least the root path
+    """
+    analysis = urlsplit(urldefrag(url)[0])
+    if not analysis.path:
+        analysis = analysis._replace(path="/")
+    return analysis.geturl()
+
+
+def get_local_page_path(args, page_url):
+    """Maps URL of a page to its file in the local docroot (the parent
+    directory of LICENSE_LOCAL_PATH)
+
+    Args:
+        page_url (str): URL of the page
+
+    Returns:
+        str: Path of the file, or None if there is no such file
+    """
+    docroot = os.path.dirname(os.path.normpath(LICENSE_LOCAL_PATH))
+    root_length = len(urlsplit(args.root_url).path)
+    path = urlsplit(page_url).path[root_length:]
+    path = os.path.join(docroot, *path.split("/"))
+    for candidate in (
+        path,
+        os.path.join(path, "index.html"),
+        "{}.html".format(path.rstrip(os.sep)),
+    ):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
 def request_local_text(license_name):
     """This function reads license content from license file stored in local
-    file system
+    file system. The raw bytes are read at once, to be decoded by the parser
+    (see parse_html).
 
     Args:
         license_name (str): Name of the license
 
     Returns:
-        str: Content of license file
+        bytes: Content of license file
     """
     filename = license_name
     path = os.path.join(LICENSE_LOCAL_PATH, filename)
     try:
-        with open(path) as lic:
+        with open(path, "rb") as lic:
             return lic.read()
     except FileNotFoundError:
         raise CheckerError(
@@ -228,14 +661,53 @@ def request_local_text(license_name):
         raise
 
 
-def create_base_link(args, filename):
-    """Generates base URL on which the license file will be displayed
+def parse_html(source_html):
+    """Parses HTML source with lxml. Bytes are handed to the parser as they
+    are, decoded with the encoding declared by the document (meta charset)
+    instead of the platform default encoding. The encoding of documents
+    starting with a byte order mark is detected by BeautifulSoup. Other
+    documents are decoded as UTF-8 if they are valid UTF-8, else as
+    Windows-1252.
+
+    Args:
+        source_html (bytes or str): HTML source
+
+    Returns:
+        class 'bs4.BeautifulSoup': Parsed document
+    """
+    from bs4 import BeautifulSoup
+    from bs4.dammit import EncodingDetector
+
+    if isinstance(source_html, bytes):
+        encoding = EncodingDetector.find_declared_encoding(
+            source_html, is_html=True
+        )
+        _, byte_order_mark = EncodingDetector.strip_byte_order_mark(
+            source_html
+        )
+        if not encoding and not byte_order_mark:
+            # Character set detectors (if installed) misread short documents
+            try:
+                source_html.decode("utf-8")
+                encoding = "utf-8"
+            except UnicodeDecodeError:
+                encoding = "windows-1252"
+        if encoding:
+            return BeautifulSoup(source_html, "lxml", from_encoding=encoding)
+    return BeautifulSoup(source_html, "lxml")
+
+
+def parse_license_filename(filename):
+    """Parses the name of a license file (without extension)
 
     Args:
         filename (str): Name of the license file
 
     Returns:
-        str: Base URL of the license file
+        set: license - license (ex. by-sa, sampling+ or zero)
+             version - version (ex. 4.0)
+             jurisdiction - jurisdiction of ported license or None
+             language - language of legal code or None
     """
     parts = filename.split("_")
 
@@ -247,50 +719,139 @@ def create_base_link(args, filename):
 
     jurisdiction = None
     language = None
-    if license.startswith("zero"):
-        path_base = "publicdomain"
-    else:
-        path_base = "licenses"
+    if not license.startswith("zero"):
         if parts and float(version) < 4.0:
             jurisdiction = parts.pop(0)
 
     if parts:
         language = parts.pop(0)
 
+    return license, version, jurisdiction, language
+
+
+def create_base_link(args, filename):
+    """Generates base URL on which the license file will be displayed
+
+    Args:
+        filename (str): Name of the license file
+
+    Returns:
+        str: Base URL of the license file
+    """
+    license, version, jurisdiction, language = parse_license_filename(filename)
+    if license.startswith("zero"):
+        path_base = "publicdomain"
+    else:
+        path_base = "licenses"
+
     legalcode = "legalcode"
     if language:
         legalcode = f"{legalcode}.{language}"
 
-    url = posixpath.join(args.root_url, path_base)
-    url = posixpath.join(url, license)
-    url = posixpath.join(url, version)
-
+    parts = [path_base, license, version]
     if jurisdiction:
-        url = posixpath.join(url, jurisdiction)
+        parts.append(jurisdiction)
+    parts.append(legalcode)
 
-    url = posixpath.join(url, legalcode)
+    return posixpath.join(args.root_url, *parts)
 
-    return url
+
+def create_license_file(args, license_name):
+    """Parses license file name into its entry of the corpus index
+
+    Args:
+        license_name (str): Name of the license file
+
+    Returns:
+        LicenseFile: Entry of the license file
+    """
+    filename = license_name[: -len(".html")]
+    if args.local:
+        path = os.path.join(LICENSE_LOCAL_PATH, license_name)
+    else:
+        path = "{}{}".format(GITHUB_BASE, license_name)
+    return LicenseFile(
+        license_name,
+        *parse_license_filename(filename),
+        create_base_link(args, filename),
+        path,
+    )
+
+
+def match_license_file(args, license_file):
+    """Checks whether license file is selected by the --license, --version,
+    --jurisdiction and --language filters
+
+    Args:
+        license_file (LicenseFile): Entry of the license file
+
+    Returns:
+        bool: True if license file is to be checked
+    """
+    for field in ("license", "version", "jurisdiction", "language"):
+        values = getattr(args, field)
+        if values and getattr(license_file, field) not in values:
+            return False
+    return True
+
+
+def get_resource_urls(tag):
+    """Gets URLs referenced by the resource-bearing attributes (see
+    RESOURCE_ATTRIBUTES) of a tag
+
+    Args:
+        tag (class 'bs4.element.Tag'): Tag referencing resources
+
+    Returns:
+        list: URLs referenced by the tag
+    """
+    urls = []
+    for attribute in RESOURCE_ATTRIBUTES.get(tag.name, []):
+        value = tag.get(attribute, "").strip()
+        if not value:
+            continue
+        if attribute == "srcset":
+            # Image candidates are separated by commas and each URL may be
+            # followed by a width or pixel density descriptor
+            for candidate in value.split(","):
+                if candidate.strip():
+                    urls.append(candidate.split()[0])
+        else:
+            urls.append(value)
+    return urls
 
 
 def get_scrapable_links(
-    args, base_url, links_in_license, context, context_printed
+    args, base_url, links_in_license, context, context_printed, resolver=None
 ):
     """Filters out anchor tags without href attribute, internal links and
-    mailto scheme links
+    mailto scheme links. Resources referenced by other tags (see
+    RESOURCE_ATTRIBUTES) are included, except URLs which are not fetched
+    over the network (see NOT_FETCHED_SCHEMES)
 
     Args:
         base_url (string): URL on which the license page will be displayed
         links_in_license (list): List of all the links found in file
+        resolver (LinkResolver): Resolver creating the absolute links, whose
+            memo can be shared by several documents (default: new resolver)
 
     Returns:
         set: valid_anchors - list of all scrapable anchor tags
              valid_links - list of all absolute scrapable links
     """
-    valid_links = []
+    hrefs = []
     valid_anchors = []
     warnings = []
     for link in links_in_license:
+        if link.name != "a":
+            for href in get_resource_urls(link):
+                if href[0] == "#" or href.lower().startswith(
+                    NOT_FETCHED_SCHEMES
+                ):
+                    continue
+                hrefs.append(href)
+                valid_anchors.append(link)
+            continue
         try:
             href = link["href"]
         except KeyError:
@@ -321,9 +882,11 @@ def get_scrapable_links(
             #     "  {:<24}{}".format("Skipping mailto link ", link)
             # )
             continue
-        analyze = urlsplit(href)
-        valid_links.append(create_absolute_link(base_url, analyze))
+        hrefs.append(href)
         valid_anchors.append(link)
+    if resolver is None:
+        resolver = LinkResolver()
+    valid_links = resolver.resolve(base_url, hrefs)
     # Logging level WARNING or lower
     if warnings and args.log_level <= WARNING:
         print(context)
@@ -361,41 +924,145 @@ def create_absolute_link(base_url, link_analysis):
     return href
 
 
-def get_memoized_result(valid_links, valid_anchors):
-    """Get memoized result of previously checked links
+class LinkResolver(object):
+    """Creates absolute links from all the hrefs of a document at once, with
+    the same results as create_absolute_link. The absolute link of each href
+    is memoized across documents, keyed by the href alone when the base URL
+    does not matter (absolute links), else by the parts of the base URL it
+    depends on: scheme and host, and the directory for relative paths which
+    do not start with a slash.
 
     Args:
-        valid_links (list): List of all scrapable links in license
-        valid_anchors (list): List of all scrapable anchor tags in license
+        max_memory (int): Number of absolute links memoized before the memo
+            is cleared
+    """
+
+    def __init__(self, max_memory=RESOLVER_MEMORY):
+        self.max_memory = max_memory
+        self.clear()
+
+    def clear(self):
+        """Clears the memo"""
+        # Absolute link keyed by href, for hrefs independent of the base URL
+        self.absolute_links = {}
+        # Hrefs which are relative to the base URL, as rebuilt by urlsplit
+        # keyed by href
+        self.relative_hrefs = {}
+        # Absolute link keyed by (scheme, host, directory, href)
+        self.relative_links = {}
+        # (scheme, host, directory) keyed by base URL
+        self.base_keys = {}
+
+    def get_base_key(self, base_url):
+        """Gets the parts of a base URL which relative links depend on
+
+        Args:
+            base_url (str): URL on which the document will be displayed
+
+        Returns:
+            tuple: Scheme, host and directory (path up to the last slash) of
+                the base URL
+        """
+        base_key = self.base_keys.get(base_url)
+        if base_key is None and not base_url:
+            # urljoin leaves the links unchanged
+            base_key = (None, None, None)
+        if base_key is None:
+            base = urlsplit(base_url)
+            directory = base.path
+            if directory.startswith("/"):
+                directory = directory[: directory.rfind("/") + 1]
+            base_key = (base.scheme, base.netloc, directory)
+            self.base_keys[base_url] = base_key
+        return base_key
+
+    def resolve(self, base_url, hrefs):
+        """Creates absolute links from the hrefs of a document
+
+        Args:
+            base_url (str): URL on which the document will be displayed
+            hrefs (list): Hrefs found in the document
+
+        Returns:
+            list: Absolute links corresponding to hrefs
+        """
+        memoized = len(self.absolute_links) + len(self.relative_links)
+        if memoized > self.max_memory:
+            self.clear()
+        links = []
+        base_key = None
+        for href in hrefs:
+            link = self.absolute_links.get(href)
+            if link is not None:
+                links.append(link)
+                continue
+            relative_href = self.relative_hrefs.get(href)
+            if relative_href is None:
+                analysis = urlsplit(href)
+                if (
+                    analysis.scheme == ""
+                    and analysis.netloc == ""
+                    and analysis.path != ""
+                ):
+                    relative_href = analysis.geturl()
+                    self.relative_hrefs[href] = relative_href
+                else:
+                    link = create_absolute_link(base_url, analysis)
+                    self.absolute_links[href] = link
+                    links.append(link)
+                    continue
+            if base_key is None:
+                base_key = self.get_base_key(base_url)
+            scheme, netloc, directory = base_key
+            if relative_href.startswith("//"):
+                # Parsed again by urljoin as a host
+                directory = base_url
+            elif relative_href[0] == "/":
+                # Absolute paths do not depend on the base URL path
+                directory = None
+            key = (scheme, netloc, directory, href)
+            link = self.relative_links.get(key)
+            if link is None:
+                link = urljoin(base_url, relative_href)
+                self.relative_links[key] = link
+            links.append(link)
+        return links
+
+
+def load_history(history_path):
+    """Loads the license files which had broken links in previous runs
+
+    Args:
+        history_path (str): Path of the history file
 
     Returns:
-        set: stored_links - List of links whose responses are memoized
-             stored_anchors - List of anchor tags corresponding to stored_links
-             stored_result - List of responses corresponding to stored_links
-             check_links - List of links which are to be checked
-             check_anchors - List of anchor tags corresponding to check_links
-    """
-    stored_links = []
-    stored_anchors = []
-    stored_result = []
-    check_links = []
-    check_anchors = []
-    for idx, link in enumerate(valid_links):
-        status = MEMOIZED_LINKS.get(link)
-        if status:
-            stored_anchors.append(valid_anchors[idx])
-            stored_result.append(status)
-            stored_links.append(link)
-        else:
-            check_links.append(link)
-            check_anchors.append(valid_anchors[idx])
-    return (
-        stored_links,
-        stored_anchors,
-        stored_result,
-        check_links,
-        check_anchors,
-    )
+        dict: Number of broken links keyed by license file name
+    """
+    try:
+        with open(history_path, encoding="utf-8") as history_file:
+            history = json.load(history_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        raise CheckerError("Invalid history file ({})".format(history_path))
+    return history.get("failed_licenses", {})
+
+
+def save_history(history_path, failed_licenses):
+    """Records the license files which had broken links
+
+    Args:
+        history_path (str): Path of the history file
+        failed_licenses (dict): Number of broken links keyed by license file
+            name
+    """
+    with open(history_path, "w", encoding="utf-8") as history_file:
+        json.dump(
+            {"failed_licenses": failed_licenses},
+            history_file,
+            indent=2,
+            sort_keys=True,
+        )
 
 
 def exception_handler(request, exception):
@@ -409,6 +1076,7 @@ def exception_handler(request, exception):
     Returns:
         str: Exception occured in string format
     """
+    _, requests = import_network()
     if type(exception) == requests.exceptions.ConnectionError:
         return "Connection Error"
     elif type(exception) == requests.exceptions.ConnectTimeout:
@@ -419,79 +1087,803 @@ def exception_handler(request, exception):
         return type(exception).__name__
 
 
-def memoize_result(check_links, responses):
-    """Memoize the result of links checked
+def get_link_host(link):
+    """Gets the host name of a link
+
+    Args:
+        link (str): Link
+
+    Returns:
+        str: Host name in lower case, or None if link has none
+    """
+    try:
+        return urlsplit(link).hostname
+    except ValueError:
+        return None
+
+
+def get_link_proxy(link):
+    """Gets the proxy through which requests sends a link, as set by the
+    HTTP_PROXY, HTTPS_PROXY, ALL_PROXY and NO_PROXY environment variables
+
+    Args:
+        link (str): Link
+
+    Returns:
+        str: URL of the proxy, or None if link is requested directly
+    """
+    _, requests = import_network()
+    try:
+        proxies = requests.utils.get_environ_proxies(link)
+    except ValueError:
+        return None
+    return requests.utils.select_proxy(link, proxies)
+
+
+class DNSCache(object):
+    """Caches the addresses of host names in process, so that each host is
+    resolved once (and not again on every new connection, inside the timed
+    window of the request). Unknown hosts (see NXDOMAIN_ERRORS) are cached
+    too. Other failures (ex. temporary or resolver failures) are not cached.
+
+    The system resolver does not expose the TTL of the DNS records, so the
+    entries expire after a fixed time instead.
+
+    Args:
+        ttl (float): Time in seconds for which entries are cached
+    """
+
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        # Tuple of (addresses, expiry time) keyed by host name
+        self.entries = {}
+        # Time taken to resolve the host names, in seconds
+        self.resolve_times = {}
+
+    def lookup(self, host):
+        """Gets the cached addresses of a host name
+
+        Args:
+            host (str): Host name
+
+        Returns:
+            list: Addresses of the host, empty if the host is unknown, or None
+                if the host is not cached or its entry expired
+        """
+        entry = self.entries.get(host)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def resolve(self, host):
+        """Gets the addresses of a host name, resolving it if not cached
+
+        Args:
+            host (str): Host name
+
+        Returns:
+            list: Addresses of the host, empty if the host is unknown, or None
+                if it could not be resolved for now
+        """
+        addresses = self.lookup(host)
+        if addresses is not None:
+            return addresses
+        started = time.time()
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if e.errno not in NXDOMAIN_ERRORS:
+                return None
+            infos = []
+        except (OSError, UnicodeError):
+            return None
+        self.resolve_times[host] = time.time() - started
+        # Keep the order of the resolver (preferred address first)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self.entries[host] = (addresses, time.monotonic() + self.ttl)
+        return addresses
+
+    def is_unknown(self, host):
+        """Checks whether a host name does not exist
+
+        Args:
+            host (str): Host name
+
+        Returns:
+            bool: True if the host name has no address
+        """
+        return self.resolve(host) == []
+
+    def prewarm(self, hosts):
+        """Resolves the host names which are not cached concurrently
+
+        Args:
+            hosts (iterable): Host names
+
+        Returns:
+            list: Host names which were resolved
+        """
+        import_network()
+        import gevent.pool
+
+        hosts = [host for host in set(hosts) if self.lookup(host) is None]
+        gevent.pool.Pool(MAX_CONCURRENT_REQUESTS).map(self.resolve, hosts)
+        return hosts
+
+
+def create_http_adapter(dns_cache):
+    """Creates the HTTP adapter of the session, whose connection pools are
+    sized for MAX_CONCURRENT_REQUESTS. New connections use the addresses held
+    by dns_cache instead of resolving the host name again.
+
+    Args:
+        dns_cache (DNSCache): Cache of the addresses of host names
+
+    Returns:
+        class 'requests.adapters.HTTPAdapter': Adapter to mount on a session
+    """
+    _, requests = import_network()
+    from urllib3 import connectionpool, exceptions
+
+    def cached(connection_class):
+        class CachedConnection(connection_class):
+            def _new_conn(self):
+                # The host name is kept for the Host header and TLS (SNI and
+                # certificate checks), only the socket uses the address
+                host = self._dns_host
+                error = None
+                for address in dns_cache.resolve(host) or [host]:
+                    self._dns_host = address
+                    try:
+                        return super()._new_conn()
+                    except exceptions.ConnectTimeoutError as e:
+                        # Also caught: NewConnectionError
+                        error = e
+                    finally:
+                        self._dns_host = host
+                raise error
+
+        return CachedConnection
+
+    class CachedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+        ConnectionCls = cached(connectionpool.HTTPConnectionPool.ConnectionCls)
+
+    class CachedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+        ConnectionCls = cached(
+            connectionpool.HTTPSConnectionPool.ConnectionCls
+        )
+
+    class CachedHTTPAdapter(requests.adapters.HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": CachedHTTPConnectionPool,
+                "https": CachedHTTPSConnectionPool,
+            }
+
+    return CachedHTTPAdapter(
+        pool_connections=MAX_CONCURRENT_REQUESTS,
+        pool_maxsize=MAX_CONCURRENT_REQUESTS,
+    )
+
+
+class HTTP2Response(object):
+    """Response received over HTTP/2, with the attributes of
+    class 'requests.Response' used to check links
+
+    Args:
+        status_code (int): Response status code
+    """
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+class HTTP2Request(object):
+    """Request sent over HTTP/2, with the attributes of
+    class 'grequests.AsyncRequest' used to check links, so that its outcome is
+    reported by exception_handler and is_transient like any other request
+
+    Args:
+        url (str): Link requested
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.response = None
+        self.exception = None
+
+
+class HTTP2Connection(object):
+    """HTTP/2 connection to a server, on which the HEAD requests of several
+    links are multiplexed. A greenlet reads the frames sent by the server and
+    hands each response to the request waiting for it.
 
     Args:
-        check_links (list): List of fresh links that are processed
-        responses (list): List of response status codes corresponding to
-            check_links
+        server (tuple): Host name and port of the server
+        ssl_context (ssl.SSLContext): Context of the TLS connection, which
+            offers h2 with ALPN
+        dns_cache (DNSCache): Cache of the addresses of host names
     """
-    for idx, link in enumerate(check_links):
-        MEMOIZED_LINKS[link] = responses[idx]
+
+    def __init__(self, server, ssl_context, dns_cache=None):
+        self.server = server
+        self.ssl_context = ssl_context
+        self.dns_cache = dns_cache
+        self.sock = None
+        self.h2 = None
+        self.closed = False
+        # gevent.event.AsyncResult of the requests keyed by stream id
+        self.streams = {}
+        self.slots = None
+        self.write_lock = None
+
+    def connect(self):
+        """Opens the connection and negotiates HTTP/2 with the server
+
+        Returns:
+            bool: True if the server speaks HTTP/2, else the connection is
+                closed
+        """
+        import gevent
+        import gevent.lock
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        host, port = self.server
+        addresses = None
+        if self.dns_cache is not None:
+            addresses = self.dns_cache.resolve(host)
+        for address in addresses or [host]:
+            try:
+                sock = socket.create_connection(
+                    (address, port), timeout=REQUESTS_TIMEOUT
+                )
+                break
+            except OSError as e:
+                error = e
+        else:
+            raise error
+        try:
+            self.sock = self.ssl_context.wrap_socket(
+                sock, server_hostname=host
+            )
+        except BaseException:
+            sock.close()
+            raise
+        if self.sock.selected_alpn_protocol() != "h2":
+            self.close()
+            return False
+        config = h2.config.H2Configuration(header_encoding="utf-8")
+        self.h2 = h2.connection.H2Connection(config)
+        self.h2.initiate_connection()
+        self.sock.sendall(self.h2.data_to_send())
+        # The server starts with its settings, which limit the number of
+        # concurrent streams
+        settings = None
+        while settings is None:
+            data = self.sock.recv(65535)
+            if not data:
+                self.close()
+                raise ConnectionResetError("Connection closed by the server")
+            for event in self.h2.receive_data(data):
+                if isinstance(event, h2.events.RemoteSettingsChanged):
+                    settings = self.h2.remote_settings
+        self.sock.sendall(self.h2.data_to_send())
+        self.sock.settimeout(None)
+        self.slots = gevent.lock.Semaphore(
+            min(HTTP2_MAX_STREAMS, settings.max_concurrent_streams)
+        )
+        self.write_lock = gevent.lock.Semaphore()
+        gevent.spawn(self.read_frames)
+        return True
+
+    def send(self):
+        """Sends the pending frames to the server"""
+        with self.write_lock:
+            data = self.h2.data_to_send()
+            if data:
+                self.sock.sendall(data)
+
+    def read_frames(self):
+        """Reads the frames sent by the server until the connection is closed
+        and sets the outcome of the requests"""
+        import h2.events
+        import h2.exceptions
+
+        error = ConnectionResetError("Connection closed by the server")
+        try:
+            while not self.closed:
+                data = self.sock.recv(65535)
+                if not data:
+                    break
+                for event in self.h2.receive_data(data):
+                    result = self.streams.get(getattr(event, "stream_id", 0))
+                    if isinstance(event, h2.events.ResponseReceived):
+                        status = int(dict(event.headers)[":status"])
+                        if result is not None:
+                            result.set(status)
+                    elif isinstance(event, h2.events.StreamReset):
+                        if result is not None:
+                            result.set_exception(
+                                ConnectionResetError(
+                                    "Stream reset by the server"
+                                )
+                            )
+                    elif isinstance(event, h2.events.DataReceived):
+                        self.h2.acknowledge_received_data(
+                            event.flow_controlled_length, event.stream_id
+                        )
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        self.closed = True
+                self.send()
+        except (OSError, h2.exceptions.ProtocolError) as e:
+            error = e
+        self.close(error)
+
+    def close(self, error=None):
+        """Closes the connection, failing the requests waiting for a response
+
+        Args:
+            error (Exception): Exception set as outcome of the requests
+        """
+        self.closed = True
+        for result in self.streams.values():
+            if not result.ready():
+                result.set_exception(error)
+        self.streams = {}
+        if self.sock is not None:
+            self.sock.close()
+
+    def head(self, link):
+        """Sends a HEAD request on the connection and waits for the response
+
+        Args:
+            link (str): Link requested
+
+        Returns:
+            int: Response status code
+        """
+        _, requests = import_network()
+        import gevent
+        import gevent.event
+        import h2.errors
+        import h2.exceptions
+
+        parts = urlsplit(link)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        headers = [
+            (":method", "HEAD"),
+            (":authority", parts.netloc.rpartition("@")[2]),
+            (":scheme", parts.scheme),
+            (":path", requests.utils.requote_uri(path)),
+            *((name.lower(), value) for name, value in HEADER.items()),
+        ]
+        with self.slots:
+            if self.closed:
+                raise ConnectionResetError("Connection closed")
+            stream_id = self.h2.get_next_available_stream_id()
+            result = gevent.event.AsyncResult()
+            self.streams[stream_id] = result
+            try:
+                self.h2.send_headers(stream_id, headers, end_stream=True)
+                self.send()
+                return result.get(timeout=REQUESTS_TIMEOUT)
+            except gevent.Timeout:
+                try:
+                    self.h2.reset_stream(
+                        stream_id, h2.errors.ErrorCodes.CANCEL
+                    )
+                    self.send()
+                except (OSError, h2.exceptions.ProtocolError):
+                    pass
+                raise socket.timeout("Read timed out")
+            finally:
+                self.streams.pop(stream_id, None)
+
+
+class HTTP2Transport(object):
+    """Sends HEAD requests to HTTPS servers over HTTP/2, on one connection
+    per server. Servers which do not negotiate HTTP/2 (or cannot be
+    connected to) are remembered, and their links are to be checked with
+    HTTP/1.1 instead.
+
+    Args:
+        dns_cache (DNSCache): Cache of the addresses of host names
+        ssl_context (ssl.SSLContext): Context of the TLS connections (default:
+            certificates verified against the CA bundle used by requests)
+    """
+
+    def __init__(self, dns_cache=None, ssl_context=None):
+        self.dns_cache = dns_cache
+        self.ssl_context = ssl_context
+        # HTTP2Connection keyed by (host, port)
+        self.connections = {}
+        self.connect_locks = {}
+        self.http1_servers = set()
+
+    def get_ssl_context(self):
+        """Creates the TLS context on first use
+
+        Returns:
+            ssl.SSLContext: Context offering h2 and http/1.1 with ALPN
+        """
+        if self.ssl_context is None:
+            _, requests = import_network()
+            import ssl
+
+            self.ssl_context = ssl.create_default_context(
+                cafile=requests.certs.where()
+            )
+        self.ssl_context.set_alpn_protocols(["h2", "http/1.1"])
+        return self.ssl_context
+
+    def get_connection(self, server):
+        """Gets the HTTP/2 connection to a server, opening it if needed. The
+        requests waiting for the same server share the connection opened.
+
+        Args:
+            server (tuple): Host name and port of the server
+
+        Returns:
+            HTTP2Connection: Connection, or None if the server is to be
+                checked with HTTP/1.1
+        """
+        import gevent.lock
+
+        lock = self.connect_locks.setdefault(server, gevent.lock.Semaphore())
+        with lock:
+            if server in self.http1_servers:
+                return None
+            connection = self.connections.get(server)
+            if connection is None or connection.closed:
+                connection = HTTP2Connection(
+                    server, self.get_ssl_context(), self.dns_cache
+                )
+                try:
+                    supported = connection.connect()
+                except BaseException:
+                    self.http1_servers.add(server)
+                    raise
+                if not supported:
+                    self.http1_servers.add(server)
+                    return None
+                self.connections[server] = connection
+            return connection
+
+    def head(self, link):
+        """Checks a link with a HEAD request over HTTP/2
+
+        Args:
+            link (str): Link which is to be checked
+
+        Returns:
+            HTTP2Request: Request with its response or exception (as raised by
+                requests), or None if the link is to be checked with HTTP/1.1
+        """
+        _, requests = import_network()
+        import h2.exceptions
+        import ssl
+
+        try:
+            parts = urlsplit(link)
+            server = (parts.hostname, parts.port or 443)
+        except ValueError:
+            return None
+        if parts.scheme != "https" or server in self.http1_servers:
+            return None
+        request = HTTP2Request(link)
+        try:
+            connection = self.get_connection(server)
+            if connection is None:
+                return None
+        except ssl.SSLError as e:
+            request.exception = requests.exceptions.SSLError(e)
+            return request
+        except socket.timeout as e:
+            request.exception = requests.exceptions.ConnectTimeout(e)
+            return request
+        except (OSError, h2.exceptions.ProtocolError) as e:
+            request.exception = requests.exceptions.ConnectionError(e)
+            return request
+        try:
+            request.response = HTTP2Response(connection.head(link))
+        except socket.timeout as e:
+            request.exception = requests.exceptions.ReadTimeout(e)
+        except (OSError, h2.exceptions.ProtocolError) as e:
+            request.exception = requests.exceptions.ConnectionError(e)
+        return request
 
 
-def write_response(
-    args,
-    all_links,
-    response,
-    base_url,
-    license_name,
-    valid_anchors,
-    context,
-    context_printed,
+def is_transient(request):
+    """Classifies the outcome of a request as transient (timeouts, connection
+    resets, temporary DNS failures, 5xx and 429 responses) or permanent
+    (other responses, DNS NXDOMAIN, SSL and proxy errors, invalid schema,
+    etc.)
+
+    Args:
+        request (class 'grequests.AsyncRequest'): Request which was sent
+
+    Returns:
+        bool: True if the request may succeed when retried
+    """
+    _, requests = import_network()
+    if request.response is not None:
+        status = request.response.status_code
+        return status == 429 or status >= 500
+    exception = request.exception
+    if isinstance(exception, requests.exceptions.Timeout):
+        return True
+    if not isinstance(exception, requests.exceptions.ConnectionError):
+        return False
+    # Certificate and proxy errors are subclasses of ConnectionError which
+    # fail again when retried
+    if isinstance(
+        exception,
+        (requests.exceptions.SSLError, requests.exceptions.ProxyError),
+    ):
+        return False
+    # Look for a DNS failure among the chained urllib3/socket exceptions
+    causes = [exception]
+    while causes:
+        cause = causes.pop()
+        if isinstance(cause, socket.gaierror):
+            return cause.errno == socket.EAI_AGAIN
+        for chained in (
+            getattr(cause, "reason", None),
+            cause.__cause__,
+            cause.__context__,
+            *cause.args,
+        ):
+            if isinstance(chained, BaseException):
+                causes.append(chained)
+    return True
+
+
+def get_retry_delay(attempt):
+    """Gets a random delay before retrying a link (capped exponential backoff
+    with full jitter)
+
+    Args:
+        attempt (int): Number of the failed attempt
+
+    Returns:
+        float: Delay in seconds
+    """
+    return random.uniform(
+        0, min(RETRY_MAX_DELAY, RETRY_BACKOFF * 2 ** (attempt - 1))
+    )
+
+
+def fetch_link_status(
+    check_links,
+    session=None,
+    get_hosts=None,
+    retries=0,
+    deadline=None,
+    dns_cache=None,
+    http2=None,
 ):
-    """Writes broken links to CLI and file
+    """Checks links concurrently and yields their outcome as each completes.
+    check_links may be any iterable (ex. lines streamed on stdin): each link
+    is checked as soon as it is produced. Links are checked with a HEAD
+    request and, if the server refuses it (see HEAD_FALLBACK_STATUS), with a
+    GET request reading only the start of the body. Hosts for which the GET
+    request succeeded are added to get_hosts and their links are checked
+    directly with a GET request. Links failing with a transient error are
+    retried after a delay, without holding a slot of the pool meanwhile.
+    Links to hosts which dns_cache knows not to exist (unless they are sent
+    through a proxy) are reported as UNKNOWN_HOST and links which cannot be
+    parsed as INVALID_URL, without sending any request. If http2 is given,
+    the HEAD requests to servers supporting HTTP/2 are sent with it, except
+    those sent through a proxy.
 
     Args:
-        all_links (list): List of all scrapable links found in website
-        response (list): Response status code/ exception of all the links in
-            all_links
-        base_url (string): URL on which the license page will be displayed
-        license_name (string): Name of license
-        valid_anchors (list): List of all the scrapable anchors
+        check_links (iterable): Links which are to be checked
+        session (class 'requests.Session'): Session whose connection pool is
+            used for the requests
+        get_hosts (set): Hosts which are to be checked with GET requests
+        retries (int): Number of times a link failing with a transient error
+            is retried
+        deadline (float): Time (as returned by time.time) after which links
+            are not retried anymore
+        dns_cache (DNSCache): Cache of the addresses of host names. Hosts
+            are resolved before the time taken by the request is measured.
+        http2 (HTTP2Transport): Transport multiplexing the HEAD requests over
+            HTTP/2
+
+    Yields:
+        tuple: link, response status code or exception string, time taken in
+            seconds by the last attempt, HTTP method used and number of
+            attempts
+    """
+    grequests, requests = import_network()
+    import gevent
+    from gevent.queue import Queue
+
+    if get_hosts is None:
+        get_hosts = set()
+
+    def send_get(link):
+        request = grequests.get(
+            link, timeout=REQUESTS_TIMEOUT, session=session, stream=True
+        )
+        request.send()
+        if request.response is not None:
+            try:
+                next(request.response.iter_content(GET_FALLBACK_BYTES), None)
+            except requests.exceptions.RequestException:
+                pass
+        return request
+
+    def send(index, host, proxy):
+        link = links[index]
+        started = time.time()
+        if host in get_hosts:
+            request = send_get(link)
+            return request, time.time() - started, "GET"
+        # Since we're only checking for validity, we can retreive only the
+        # headers/metadata
+        request = None
+        if http2 is not None and not proxy:
+            request = http2.head(link)
+        if request is None:
+            request = grequests.head(
+                link, timeout=REQUESTS_TIMEOUT, session=session
+            )
+            request.send()
+        method = "HEAD"
+        if (
+            request.response is not None
+            and request.response.status_code in HEAD_FALLBACK_STATUS
+        ):
+            fallback = send_get(link)
+            if fallback.response is not None:
+                request.response.close()
+                request = fallback
+                method = "GET"
+                if request.response.status_code in GOOD_RESPONSE:
+                    get_hosts.add(host)
+        return request, time.time() - started, method
+
+    def attempt(index, attempts):
+        try:
+            try:
+                analysis = urlsplit(links[index])
+            except ValueError:
+                outcomes.put((index, attempts, INVALID_URL, 0.0, "HEAD"))
+                return
+            host = analysis.hostname
+            proxy = get_link_proxy(links[index])
+            if (
+                dns_cache is not None
+                and host
+                and not proxy
+                and dns_cache.is_unknown(host)
+            ):
+                outcomes.put((index, attempts, UNKNOWN_HOST, 0.0, "HEAD"))
+                return
+            sent = send(index, analysis.netloc, proxy)
+            outcomes.put((index, attempts, *sent))
+        except BaseException as e:
+            outcomes.put(e)
+
+    def produce():
+        try:
+            for link in check_links:
+                links.append(link)
+                pool.spawn(attempt, len(links) - 1, 1)
+        except BaseException as e:
+            outcomes.put(e)
+        # All the links are produced
+        outcomes.put(None)
+
+    links = []
+    outcomes = Queue()
+    pool = grequests.Pool(MAX_CONCURRENT_REQUESTS)
+    gevent.spawn(produce)
+    produced = False
+    completed = 0
+    while not produced or completed < len(links):
+        outcome = outcomes.get()
+        if outcome is None:
+            produced = True
+            continue
+        if isinstance(outcome, BaseException):
+            raise outcome
+        index, attempts, request, elapsed, method = outcome
+        if isinstance(request, str):
+            # Permanent failure found without sending any request
+            completed += 1
+            yield links[index], request, elapsed, method, attempts
+            continue
+        retry = attempts <= retries and is_transient(request)
+        if retry:
+            delay = get_retry_delay(attempts)
+            retry = deadline is None or time.time() + delay < deadline
+        if request.response is not None:
+            status = request.response.status_code
+            # Explicitly close connections to free up file handles and avoid
+            # Connection Errors per: https://stackoverflow.com/a/22839550
+            request.response.close()
+        else:
+            status = exception_handler(request, request.exception)
+        if retry:
+            gevent.spawn_later(
+                delay,
+                pool.spawn,
+                attempt,
+                index,
+                attempts + 1,
+            )
+            continue
+        completed += 1
+        yield links[index], status, elapsed, method, attempts
+
+
+def load_cassette(cassette_file):
+    """Loads link check outcomes recorded by --record
+
+    Args:
+        cassette_file (file): Cassette file opened for reading
 
     Returns:
-        int: Number of broken links found in license
+        dict: Tuple of (status, elapsed, method, attempts) keyed by link
     """
-    caught_errors = 0
-    for idx, link_status in enumerate(response):
+    outcomes = {}
+    for line_number, line in enumerate(cassette_file, start=1):
+        if not line.strip():
+            continue
         try:
-            status = link_status.status_code
-        except AttributeError:
-            status = link_status
-        if status not in GOOD_RESPONSE:
-            map_links_file(all_links[idx], base_url)
-            caught_errors += 1
-            if caught_errors == 1:
-                if args.log_level <= ERROR:
-                    if not context_printed:
-                        print(context)
-                    print("Errors:")
-                output_write(
-                    args, "\n{}\nURL: {}".format(license_name, base_url)
+            entry = json.loads(line)
+            outcomes[entry["url"]] = (
+                entry["status"],
+                entry["elapsed"],
+                entry.get("method", "HEAD"),
+                entry.get("attempts", 1),
+            )
+        except (ValueError, KeyError, TypeError):
+            raise CheckerError(
+                "Invalid cassette entry ({}:{})".format(
+                    cassette_file.name, line_number
                 )
-            result = "  {:<24}{}\n{}{}".format(
-                str(status), all_links[idx], " " * 26, valid_anchors[idx]
             )
-            if args.log_level <= ERROR:
-                print(result)
-            output_write(args, result)
-    return caught_errors
+    return outcomes
 
 
-def map_links_file(link, file_url):
-    """Maps broken link to the files of occurence
+def record_outcome(
+    args, link, status, elapsed, method="HEAD", attempts=1, resolved=None
+):
+    """Writes link check outcome to cassette file if --record flag is set
 
     Args:
-        link (str): Broken link encountered
-        file_url (str): File url in which the broken link was encountered
+        link (str): Link that was checked
+        status (int or str): Response status code or exception string
+        elapsed (float): Time taken to check the link in seconds (connection
+            and response, without the host name resolution)
+        method (str): HTTP method used to check the link
+        attempts (int): Number of attempts made to check the link
+        resolved (float): Time taken to resolve the host name of the link in
+            seconds
     """
-    if MAP_BROKEN_LINKS.get(link):
-        if file_url not in MAP_BROKEN_LINKS[link]:
-            MAP_BROKEN_LINKS[link].append(file_url)
-    else:
-        MAP_BROKEN_LINKS[link] = [file_url]
+    if args.record:
+        entry = {
+            "url": link,
+            "method": method,
+            "status": status,
+            "elapsed": round(elapsed, 3),
+        }
+        if attempts > 1:
+            entry["attempts"] = attempts
+        if resolved is not None:
+            entry["resolved"] = round(resolved, 3)
+        print(json.dumps(entry, separators=(",", ":")), file=args.record)
 
 
 def output_write(args, *args_, **kwargs):
@@ -502,134 +1894,1199 @@ def output_write(args, *args_, **kwargs):
         print(*args_, **kwargs)
 
 
-def output_summary(args, license_names, num_errors):
-    """Prints short summary of broken links in the output error file
-
-    Args:
-        license_names: Array of link to license files
-        num_errors (int): Number of broken links found
+class ResultStore(object):
+    """Broken links found by a check, indexed both by link and by the file
+    (license file, page or URL list) in which they were found, along with
+    the files checked. Results of two checks can be compared to find the
+    links which are newly broken, still broken or fixed.
     """
-    output_write(
-        args, "\n\n{}\n{} SUMMARY\n{}\n".format("*" * 39, " " * 15, "*" * 39)
-    )
-    output_write(args, "Timestamp: {}".format(time.ctime()))
-    output_write(args, "Total files checked: {}".format(len(license_names)))
-    output_write(args, "Number of error links: {}".format(num_errors))
-    keys = MAP_BROKEN_LINKS.keys()
-    output_write(args, "Number of unique broken links: {}\n".format(len(keys)))
-    for key, value in MAP_BROKEN_LINKS.items():
-        output_write(args, "\nBroken link - {} found in:".format(key))
-        for url in value:
-            output_write(args, url)
+
+    def __init__(self):
+        # Files checked (dict used as an ordered set)
+        self.files = {}
+        # Response status code or exception string keyed by file keyed by
+        # broken link
+        self.broken_links = {}
+        # Set of broken links keyed by file
+        self.file_links = {}
+
+    def __len__(self):
+        return len(self.broken_links)
+
+    def add_file(self, file_url):
+        """Records a file as checked
+
+        Args:
+            file_url (str): File url which was checked
+        """
+        self.files[file_url] = None
+
+    def add(self, link, file_url, status=None):
+        """Records a broken link found in a file
+
+        Args:
+            link (str): Broken link
+            file_url (str): File url in which the broken link was found
+            status (int or str): Response status code or exception string
+        """
+        self.add_file(file_url)
+        self.broken_links.setdefault(link, {})[file_url] = status
+        self.file_links.setdefault(file_url, set()).add(link)
+
+    def remove_file(self, file_url):
+        """Removes a file and the broken links found in it
+
+        Args:
+            file_url (str): File url
+        """
+        self.files.pop(file_url, None)
+        for link in self.file_links.pop(file_url, ()):
+            file_statuses = self.broken_links[link]
+            del file_statuses[file_url]
+            if not file_statuses:
+                del self.broken_links[link]
+
+    def get_map(self):
+        """Gets the files in which each broken link was found
+
+        Returns:
+            dict: List of file urls keyed by broken link
+        """
+        return {
+            link: list(file_statuses)
+            for link, file_statuses in self.broken_links.items()
+        }
+
+    def get_file_links(self, file_url):
+        """Gets the broken links found in a file
+
+        Args:
+            file_url (str): File url
+
+        Returns:
+            list: Tuples of (broken link, response status code or exception
+                string) sorted by link
+        """
+        return [
+            (link, self.broken_links[link][file_url])
+            for link in sorted(self.file_links.get(file_url, ()))
+        ]
+
+    def get_pairs(self):
+        """Gets the broken links along with the file they were found in
+
+        Returns:
+            set: Tuples of (broken link, file url)
+        """
+        return {
+            (link, file_url)
+            for link, file_statuses in self.broken_links.items()
+            for file_url in file_statuses
+        }
+
+    def diff(self, baseline):
+        """Compares the broken links with the ones of a baseline. Links of
+        the baseline are fixed only if their file was checked again.
+
+        Args:
+            baseline (ResultStore): Results of a previous check
+
+        Returns:
+            set: newly_broken - Set of (link, file url) broken only now
+                 still_broken - Set of (link, file url) broken in both
+                 fixed - Set of (link, file url) broken only in baseline
+        """
+        pairs = self.get_pairs()
+        baseline_pairs = baseline.get_pairs()
+        fixed = {
+            (link, file_url)
+            for link, file_url in baseline_pairs - pairs
+            if file_url in self.files
+        }
+        return pairs - baseline_pairs, pairs & baseline_pairs, fixed
+
+    def save(self, results_path):
+        """Saves the results to a JSON file
+
+        Args:
+            results_path (str): Path of the results file
+        """
+        with open(results_path, "w", encoding="utf-8") as results_file:
+            json.dump(
+                {
+                    "files": list(self.files),
+                    "broken_links": [
+                        {"url": link, "file": file_url, "status": status}
+                        for link, file_statuses in self.broken_links.items()
+                        for file_url, status in file_statuses.items()
+                    ],
+                },
+                results_file,
+                indent=2,
+            )
+
+    def load(self, results_path):
+        """Loads the results saved to a JSON file
+
+        Args:
+            results_path (str): Path of the results file
+        """
+        try:
+            with open(results_path, encoding="utf-8") as results_file:
+                results = json.load(results_file)
+            for file_url in results["files"]:
+                self.add_file(file_url)
+            for entry in results["broken_links"]:
+                self.add(entry["url"], entry["file"], entry.get("status"))
+        except FileNotFoundError:
+            raise CheckerError(
+                "Results file not found ({})".format(results_path)
+            )
+        except (ValueError, KeyError, TypeError):
+            raise CheckerError(
+                "Invalid results file ({})".format(results_path)
+            )
 
 
-def output_test_summary(errors_total):
-    """Prints summary of script output in form of junit-xml
+class JunitReport(object):
+    """junit-xml report written incrementally, one testcase per license file
+    or page as soon as its check completes. Each testcase is written over
+    the closing tags together with new closing tags in a single write, and
+    the totals are then updated in place (see JUNIT_HEADER_WIDTH), so the
+    report is well-formed whenever it is flushed, even if the run dies. Only
+    the totals are kept in memory.
 
     Args:
-        errors_total (int): Total number of broken links
+        path (str): Path of the report file
+        classname (str): Class name of the testcases (kind of files checked)
     """
-    if not os.path.isdir("test-summary"):
-        os.mkdir("test-summary")
-    with open("test-summary/junit-xml-report.xml", "w") as test_summary:
-        time_taken = time.time() - START_TIME
-        test_case = TestCase(
-            "Broken links checker", "License files", time_taken
+
+    # Characters not allowed in XML 1.0 documents
+    invalid_characters = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+    def __init__(self, path, classname):
+        self.classname = classname
+        self.tests = 0
+        self.failures = 0
+        self.time = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "wb")
+        self.file.write(b'<?xml version="1.0" encoding="utf-8"?>\n')
+        self.file.write(b"<testsuites>\n")
+        self.header_offset = self.file.tell()
+        self.write_header()
+        self.end_offset = self.file.tell()
+        self.write_end(b"")
+
+    def quote_attribute(self, text):
+        """Quotes text as an XML attribute value
+
+        Args:
+            text (str): Text to quote
+
+        Returns:
+            str: Quoted text
+        """
+        return '"{}"'.format(
+            html.escape(self.invalid_characters.sub("", text))
+        )
+
+    def escape_text(self, text):
+        """Escapes text as XML character data
+
+        Args:
+            text (str): Text to escape
+
+        Returns:
+            str: Escaped text
+        """
+        return html.escape(self.invalid_characters.sub("", text), quote=False)
+
+    def write_header(self):
+        """Writes the opening testsuite tag with the current totals"""
+        attributes = (
+            ' name="cc-link-checker" tests="{}" failures="{}" errors="0"'
+            ' time="{:.3f}"'
+        ).format(self.tests, self.failures, self.time)
+        header = "\t<testsuite{}>\n".format(
+            attributes.ljust(JUNIT_HEADER_WIDTH)
         )
-        if errors_total != 0:
-            test_case.add_failure_info(
-                f"{errors_total} broken links found",
-                f"Number of error links: {errors_total}\nNumber of unique"
-                f" broken links: {len(MAP_BROKEN_LINKS.keys())}",
+        self.file.seek(self.header_offset)
+        self.file.write(header.encode("utf-8"))
+
+    def write_end(self, testcase, system_out=None):
+        """Writes a testcase followed by the closing tags after the last
+        testcase, in a single write, then updates the totals and flushes the
+        report
+
+        Args:
+            testcase (bytes): XML of the testcase (empty to only write the
+                closing tags)
+            system_out (str): Output of the testsuite
+        """
+        end = ""
+        if system_out:
+            end += "\t\t<system-out>{}</system-out>\n".format(
+                self.escape_text(system_out)
+            )
+        end += "\t</testsuite>\n</testsuites>\n"
+        self.file.seek(self.end_offset)
+        self.file.write(testcase + end.encode("utf-8"))
+        self.file.truncate()
+        self.end_offset += len(testcase)
+        self.write_header()
+        self.file.flush()
+
+    def add(self, name, time_taken, broken_links, caught_errors):
+        """Writes the testcase of a license file or page
+
+        Args:
+            name (str): Name of the license file or page
+            time_taken (float): Seconds taken to check the file
+            broken_links (list): Tuples of (broken link, response status code
+                or exception string) found in the file
+            caught_errors (int): Number of broken links found in the file
+        """
+        testcase = '\t\t<testcase classname={} name={} time="{:.3f}"'.format(
+            self.quote_attribute(self.classname),
+            self.quote_attribute(name),
+            time_taken,
+        )
+        if caught_errors:
+            details = "".join(
+                "\n{:<24}{}".format(str(status), link)
+                for link, status in broken_links
             )
-        ts = TestSuite("cc-link-checker", [test_case])
-        to_xml_report_file(test_summary, [ts])
+            testcase += (
+                '>\n\t\t\t<failure type="failure" message={}>{}</failure>'
+                "\n\t\t</testcase>\n"
+            ).format(
+                self.quote_attribute(f"{caught_errors} broken links found"),
+                self.escape_text(details),
+            )
+            self.failures += 1
+        else:
+            testcase += "/>\n"
+        self.tests += 1
+        self.time += time_taken
+        self.write_end(testcase.encode("utf-8"))
 
+    def close(self, stop_reason=None):
+        """Writes the output of the testsuite and closes the report
 
-def main():
-    args = parse_argument(sys.argv[1:])
+        Args:
+            stop_reason (str): Reason the run was stopped before all the
+                license files were checked
+        """
+        if stop_reason:
+            self.write_end(b"", f"Stopped early: {stop_reason}")
+        self.file.close()
 
-    if args.local:
-        license_names = get_local_licenses()
-    else:
-        license_names = get_github_licenses()
-    if args.log_level <= INFO:
-        print("Number of files to be checked:", len(license_names))
-    errors_total = 0
-    exit_status = 0
-    for license_name in license_names:
+
+class Frontier(object):
+    """Breadth-first queue of the URLs to crawl, which accepts each URL only
+    once. When more than max_memory URLs are waiting, the new ones are
+    spilled to a temporary file and read back in order.
+
+    Args:
+        max_memory (int): Number of waiting URLs kept in memory
+    """
+
+    def __init__(self, max_memory=FRONTIER_MEMORY):
+        self.max_memory = max_memory
+        # Digests instead of the URLs keep the seen-set small on large sites
+        self.seen = set()
+        self.queue = deque()
+        self.spill = None
+        self.spilled = 0
+        self.spill_offset = 0
+
+    def __len__(self):
+        return len(self.queue) + self.spilled
+
+    def add(self, url, depth):
+        """Adds URL to the frontier unless it was already added
+
+        Args:
+            url (str): URL to crawl
+            depth (int): Number of links between the root URL and url
+
+        Returns:
+            bool: True if the URL was added
+        """
+        digest = hashlib.blake2b(url.encode(), digest_size=16).digest()
+        if digest in self.seen:
+            return False
+        self.seen.add(digest)
+        if self.spilled or len(self.queue) >= self.max_memory:
+            if self.spill is None:
+                self.spill = tempfile.TemporaryFile("w+", encoding="utf-8")
+            self.spill.seek(0, os.SEEK_END)
+            self.spill.write(json.dumps([url, depth]) + "\n")
+            self.spilled += 1
+        else:
+            self.queue.append((url, depth))
+        return True
+
+    def pop(self):
+        """Removes the next URL to crawl from the frontier
+
+        Returns:
+            set: url - URL to crawl
+                 depth - Number of links between the root URL and url
+        """
+        if not self.queue and self.spilled:
+            self.spill.seek(self.spill_offset)
+            for _ in range(min(self.spilled, self.max_memory)):
+                self.queue.append(tuple(json.loads(self.spill.readline())))
+                self.spilled -= 1
+            self.spill_offset = self.spill.tell()
+            if not self.spilled:
+                self.spill.seek(0)
+                self.spill.truncate()
+                self.spill_offset = 0
+        return self.queue.popleft()
+
+
+class Checker(object):
+    """Checks license files for broken links
+
+    All the state of a check (memoized link results, broken links found and
+    HTTP connection pool) is held by the Checker instead of the module, so
+    several isolated checks can run in one process. Runs of the same Checker
+    reuse its memoized results, connection pool and the hosts which are to be
+    checked with GET requests.
+
+    Args:
+        args (argparse.Namespace): Configuration as returned by
+            parse_argument
+        memoized_links (dict): Memoized link results to start from (default:
+            empty). Can be shared by several Checkers.
+    """
+
+    def __init__(self, args, memoized_links=None):
+        self.args = args
+        self.memoized_links = {} if memoized_links is None else memoized_links
+        self.broken_links = ResultStore()
+        self.baseline = None
+        self.cassette_outcomes = {}
+        self.start_time = time.time()
+        self.session = None
+        self.license_index = {}
+        self.get_hosts = set()
+        self.link_attempts = {}
+        self.failed_licenses = {}
+        self.dns_cache = DNSCache()
+        self.link_resolver = LinkResolver()
+        self.junit_report = None
+        self.http2 = None
+        if args.history:
+            self.failed_licenses = load_history(args.history)
+        if args.replay:
+            self.cassette_outcomes = load_cassette(args.replay)
+        if args.baseline:
+            self.baseline = ResultStore()
+            self.baseline.load(args.baseline)
+
+    def get_session(self):
+        """Creates the HTTP session on first use
+
+        Returns:
+            class 'requests.Session': Session shared by all link checks
+        """
+        if self.session is None:
+            _, requests = import_network()
+            self.session = requests.Session()
+            adapter = create_http_adapter(self.dns_cache)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        return self.session
+
+    def get_http2_transport(self):
+        """Creates the HTTP/2 transport on first use if --http2 flag is set
+
+        Returns:
+            HTTP2Transport: Transport shared by all link checks, or None
+        """
+        if self.args.http2 and self.http2 is None:
+            self.http2 = HTTP2Transport(self.dns_cache)
+        return self.http2
+
+    def get_license_names(self):
+        """Gets license files from local file system if --local flag is set,
+        else from GitHub
+
+        Returns:
+            list: list of file names of license file
+        """
+        if self.args.local:
+            return get_local_licenses()
+        return get_github_licenses()
+
+    def get_license_file(self, license_name):
+        """Gets entry of license file from the corpus index, parsing its file
+        name on first use
+
+        Args:
+            license_name (str): Name of the license file
+
+        Returns:
+            LicenseFile: Entry of the license file
+        """
+        license_file = self.license_index.get(license_name)
+        if license_file is None:
+            license_file = create_license_file(self.args, license_name)
+            self.license_index[license_name] = license_file
+        return license_file
+
+    def get_license_index(self):
+        """Gets the license files selected by the --license, --version,
+        --jurisdiction and --language filters
+
+        Returns:
+            list: Entries of the license files, ordered according to
+                TEST_ORDER
+        """
+        return [
+            license_file
+            for license_file in map(
+                self.get_license_file, self.get_license_names()
+            )
+            if match_license_file(self.args, license_file)
+        ]
+
+    def get_license_source(self, license_file):
+        """Gets content of license file from local file system if --local flag
+        is set, else from GitHub
+
+        Args:
+            license_file (LicenseFile): Entry of the license file
+
+        Returns:
+            bytes: Content of license file
+        """
+        if self.args.local:
+            return request_local_text(license_file.name)
+        return request_text(license_file.path)
+
+    def get_memoized_result(self, valid_links, valid_anchors):
+        """Get memoized result of previously checked links
+
+        Args:
+            valid_links (list): List of all scrapable links in license
+            valid_anchors (list): List of all scrapable anchor tags in license
+
+        Returns:
+            set: stored_links - List of links whose responses are memoized
+                 stored_anchors - List of anchor tags corresponding to
+                    stored_links
+                 stored_result - List of responses corresponding to
+                    stored_links
+                 check_links - List of links which are to be checked
+                 check_anchors - List of anchor tags corresponding to
+                    check_links
+        """
+        stored_links = []
+        stored_anchors = []
+        stored_result = []
+        check_links = []
+        check_anchors = []
+        for idx, link in enumerate(valid_links):
+            status = self.memoized_links.get(link)
+            if status:
+                stored_anchors.append(valid_anchors[idx])
+                stored_result.append(status)
+                stored_links.append(link)
+            else:
+                check_links.append(link)
+                check_anchors.append(valid_anchors[idx])
+        return (
+            stored_links,
+            stored_anchors,
+            stored_result,
+            check_links,
+            check_anchors,
+        )
+
+    def iter_link_status(self, check_links):
+        """Gets the status of links as each check completes, either from the
+        network or, if --replay flag is set, from the cassette outcomes. The
+        number of attempts made to check links which were retried is kept in
+        link_attempts.
+
+        Args:
+            check_links (iterable): Links which are to be checked
+
+        Yields:
+            tuple: link and its response status code or exception string
+        """
+        if self.args.replay:
+            outcomes = (
+                (link, *self.cassette_outcomes.get(link, NOT_RECORDED))
+                for link in check_links
+            )
+        else:
+            deadline = None
+            if self.args.deadline:
+                deadline = self.start_time + self.args.deadline
+            outcomes = fetch_link_status(
+                check_links,
+                self.get_session(),
+                self.get_hosts,
+                self.args.retries,
+                deadline,
+                self.dns_cache,
+                self.get_http2_transport(),
+            )
+        resolve_times = self.dns_cache.resolve_times
+        for link, status, elapsed, method, attempts in outcomes:
+            resolved = resolve_times.get(get_link_host(link))
+            record_outcome(
+                self.args, link, status, elapsed, method, attempts, resolved
+            )
+            if attempts > 1:
+                self.link_attempts[link] = attempts
+            yield link, status
+
+    def check_link_status(self, check_links):
+        """Gets the status of links (see iter_link_status). Each unique link
+        is checked only once.
+
+        The host names of the links are resolved concurrently beforehand.
+
+        Args:
+            check_links (list): List of links which are to be checked
+
+        Returns:
+            list: Response status code or exception string corresponding to
+                check_links
+        """
+        unique_links = dict.fromkeys(check_links)
+        if not self.args.replay:
+            self.prewarm_dns(unique_links)
+        statuses = dict(self.iter_link_status(unique_links))
+        return [statuses[link] for link in check_links]
+
+    def prewarm_dns(self, links):
+        """Resolves the host names of links concurrently, so that the checks
+        of the links do not wait for the resolver. Links sent through a proxy
+        are resolved by the proxy instead.
+
+        Args:
+            links (iterable): Links which are to be checked
+        """
+        hosts = {
+            get_link_host(link) for link in links if not get_link_proxy(link)
+        } - {None}
+        started = time.time()
+        resolved = self.dns_cache.prewarm(hosts)
+        if resolved and self.args.log_level <= DEBUG:
+            print(
+                "Resolved {} hosts in {:.3f} seconds".format(
+                    len(resolved), time.time() - started
+                )
+            )
+
+    def memoize_result(self, check_links, responses):
+        """Memoize the result of links checked
+
+        Args:
+            check_links (list): List of fresh links that are processed
+            responses (list): List of response status codes corresponding to
+                check_links
+        """
+        for idx, link in enumerate(check_links):
+            self.memoized_links[link] = responses[idx]
+
+    def write_response(
+        self,
+        all_links,
+        response,
+        base_url,
+        license_name,
+        valid_anchors,
+        context,
+        context_printed,
+    ):
+        """Writes broken links to CLI and file
+
+        Args:
+            all_links (list): List of all scrapable links found in website
+            response (list): Response status code/ exception of all the links
+                in all_links
+            base_url (string): URL on which the license page will be displayed
+            license_name (string): Name of license
+            valid_anchors (list): List of all the scrapable anchors
+
+        Returns:
+            int: Number of broken links found in license
+        """
+        args = self.args
+        caught_errors = 0
+        for idx, link_status in enumerate(response):
+            try:
+                status = link_status.status_code
+            except AttributeError:
+                status = link_status
+            if status not in GOOD_RESPONSE:
+                self.map_links_file(all_links[idx], base_url, status)
+                caught_errors += 1
+                if caught_errors == 1:
+                    if args.log_level <= ERROR:
+                        if not context_printed:
+                            print(context)
+                        print("Errors:")
+                    output_write(
+                        args, "\n{}\nURL: {}".format(license_name, base_url)
+                    )
+                link = all_links[idx]
+                attempts = self.link_attempts.get(link, 1)
+                if attempts > 1:
+                    link = "{} ({} attempts)".format(link, attempts)
+                result = "  {:<24}{}\n{}{}".format(
+                    str(status), link, " " * 26, valid_anchors[idx]
+                )
+                if args.log_level <= ERROR:
+                    print(result)
+                output_write(args, result)
+        return caught_errors
+
+    def map_links_file(self, link, file_url, status=None):
+        """Maps broken link to the files of occurence
+
+        Args:
+            link (str): Broken link encountered
+            file_url (str): File url in which the broken link was encountered
+            status (int or str): Response status code or exception string
+        """
+        self.broken_links.add(link, file_url, status)
+
+    def forget_license(self, license_name):
+        """Removes the broken links of a license file from the previous checks
+
+        Args:
+            license_name (str): Name of the license file
+        """
+        base_url = self.get_license_file(license_name).base_url
+        self.broken_links.remove_file(base_url)
+
+    def check_license(self, license_name):
+        """Checks all the links of a license file
+
+        Args:
+            license_name (str): Name of the license file
+
+        Returns:
+            int: Number of broken links found in license
+        """
+        license_file = self.get_license_file(license_name)
+        source_html = self.get_license_source(license_file)
+        caught_errors, _ = self.check_source(
+            license_name, license_file.base_url, source_html
+        )
+        return caught_errors
+
+    def check_source(self, name, base_url, source_html):
+        """Checks all the links found in the source of a license file or page
+
+        Args:
+            name (str): Name of the license file or page
+            base_url (str): URL on which the page is displayed
+            source_html (bytes or str): Content of the page
+
+        Returns:
+            set: caught_errors - Number of broken links found in page
+                 link_results - Response status code or exception string
+                    keyed by link
+        """
+        args = self.args
+        started = time.time()
         caught_errors = 0
+        link_results = {}
         context_printed = False
-        filename = license_name[: -len(".html")]
-        base_url = create_base_link(args, filename)
-        context = f"\n\nChecking: {license_name}\nURL: {base_url}"
-        if args.local:
-            source_html = request_local_text(license_name)
-        else:
-            page_url = "{}{}".format(GITHUB_BASE, license_name)
-            source_html = request_text(page_url)
-        license_soup = BeautifulSoup(source_html, "lxml")
-        links_in_license = license_soup.find_all("a")
+        context = f"\n\nChecking: {name}\nURL: {base_url}"
+        self.broken_links.add_file(base_url)
+        license_soup = parse_html(source_html)
+        links_in_license = license_soup.find_all(["a", *RESOURCE_ATTRIBUTES])
         link_count = len(links_in_license)
         if args.log_level <= INFO:
             print(f"{context}\nNumber of links found: {link_count}")
             context_printed = True
         valid_anchors, valid_links, context_printed = get_scrapable_links(
-            args, base_url, links_in_license, context, context_printed
+            args,
+            base_url,
+            links_in_license,
+            context,
+            context_printed,
+            self.link_resolver,
         )
         if valid_links:
-            memoized_results = get_memoized_result(valid_links, valid_anchors)
+            memoized_results = self.get_memoized_result(
+                valid_links, valid_anchors
+            )
             stored_links = memoized_results[0]
             stored_anchors = memoized_results[1]
             stored_result = memoized_results[2]
             check_links = memoized_results[3]
             check_anchors = memoized_results[4]
             if check_links:
-                rs = (
-                    # Since we're only checking for validity, we can retreive
-                    # only the headers/metadata
-                    grequests.head(link, timeout=REQUESTS_TIMEOUT)
-                    for link in check_links
-                )
-                responses = list()
-                # Explicitly close connections to free up file handles and
-                # avoid Connection Errors per:
-                # https://stackoverflow.com/a/22839550
-                for response in grequests.map(
-                    rs, exception_handler=exception_handler
-                ):
-                    try:
-                        responses.append(response.status_code)
-                        response.close()
-                    except AttributeError:
-                        responses.append(response)
-                memoize_result(check_links, responses)
+                responses = self.check_link_status(check_links)
+                self.memoize_result(check_links, responses)
                 stored_anchors += check_anchors
                 stored_result += responses
             stored_links += check_links
-            caught_errors = write_response(
-                args,
+            caught_errors = self.write_response(
                 stored_links,
                 stored_result,
                 base_url,
-                license_name,
+                name,
                 stored_anchors,
                 context,
                 context_printed,
             )
+            link_results = dict(zip(stored_links, stored_result))
+        if self.junit_report is not None:
+            self.junit_report.add(
+                name,
+                time.time() - started,
+                self.broken_links.get_file_links(base_url),
+                caught_errors,
+            )
+        return caught_errors, link_results
+
+    def output_summary(self, license_names, num_errors, stop_reason=None):
+        """Prints short summary of broken links in the output error file
+
+        Args:
+            license_names: Array of link to license files
+            num_errors (int): Number of broken links found
+            stop_reason (str): Reason the run was stopped before all the
+                license files were checked
+        """
+        args = self.args
+        output_write(
+            args,
+            "\n\n{}\n{} SUMMARY\n{}\n".format("*" * 39, " " * 15, "*" * 39),
+        )
+        output_write(args, "Timestamp: {}".format(time.ctime()))
+        if stop_reason:
+            output_write(args, "Stopped early: {}".format(stop_reason))
+        output_write(
+            args, "Total files checked: {}".format(len(license_names))
+        )
+        output_write(args, "Number of error links: {}".format(num_errors))
+        output_write(
+            args,
+            "Number of unique broken links: {}\n".format(
+                len(self.broken_links)
+            ),
+        )
+        for key, value in self.broken_links.get_map().items():
+            output_write(args, "\nBroken link - {} found in:".format(key))
+            for url in value:
+                output_write(args, url)
+
+    def prioritize_licenses(self, license_names):
+        """Moves license files which had broken links in previous runs (see
+        --history) first, keeping the order of license_names otherwise
+
+        Args:
+            license_names (list): Names of the license files to check
+
+        Returns:
+            list: Names of the license files in the order to check them
+        """
+        return sorted(
+            license_names, key=lambda name: name not in self.failed_licenses
+        )
 
-        if caught_errors:
+    def get_stop_reason(self, errors_total):
+        """Checks whether the limits set by --max-errors or --deadline are
+        reached
+
+        Args:
+            errors_total (int): Number of broken links found so far
+
+        Returns:
+            str: Reason to stop checking new license files, or None
+        """
+        args = self.args
+        if args.max_errors and errors_total >= args.max_errors:
+            return f"{errors_total} broken links found (--max-errors)"
+        elapsed = time.time() - self.start_time
+        if args.deadline and elapsed >= args.deadline:
+            return f"{args.deadline} seconds elapsed (--deadline)"
+        return None
+
+    def start_check(self, classname):
+        """Resets the broken links and the start time before a check, and
+        opens the junit-xml report if --output-errors flag is set
+
+        Args:
+            classname (str): Kind of files checked, used as class name of the
+                junit-xml testcases
+        """
+        self.start_time = time.time()
+        self.broken_links = ResultStore()
+        if self.args.output_errors:
+            self.junit_report = JunitReport(JUNIT_REPORT_PATH, classname)
+
+    def run(self, license_names=None):
+        """Checks license files for broken links and writes the summaries.
+        Memoized results and the connection pool of previous runs are reused.
+        Checking new license files stops once the limits set by --max-errors
+        or --deadline are reached.
+
+        Args:
+            license_names (list): Names of the license files to check
+                (default: all the license files selected by the filters)
+
+        Returns:
+            int: Exit status, 1 if broken links were found, else 0
+        """
+        args = self.args
+        self.start_check("License files")
+        if license_names is None:
+            license_names = [
+                license_file.name for license_file in self.get_license_index()
+            ]
+        license_names = self.prioritize_licenses(license_names)
+        if args.log_level <= INFO:
+            print("Number of files to be checked:", len(license_names))
+        errors_total = 0
+        checked_names = []
+        stop_reason = None
+        for license_name in license_names:
+            stop_reason = self.get_stop_reason(errors_total)
+            if stop_reason:
+                break
+            caught_errors = self.check_license(license_name)
+            checked_names.append(license_name)
+            if caught_errors:
+                errors_total += caught_errors
+                self.failed_licenses[license_name] = caught_errors
+            else:
+                self.failed_licenses.pop(license_name, None)
+
+        if stop_reason and args.log_level <= WARNING:
+            print(
+                "\nStopped early: {} ({} of {} files checked)".format(
+                    stop_reason, len(checked_names), len(license_names)
+                )
+            )
+        if args.history:
+            save_history(args.history, self.failed_licenses)
+        return self.write_summaries(checked_names, errors_total, stop_reason)
+
+    def write_summaries(self, checked_names, errors_total, stop_reason):
+        """Prints the time taken and writes the summaries if --output-errors
+        flag is set. The broken links are saved if --results flag is set and
+        compared with the baseline if --baseline flag is set.
+
+        Args:
+            checked_names (list): Names of the license files or pages checked
+            errors_total (int): Total number of broken links
+            stop_reason (str): Reason the run was stopped before all the
+                license files or pages were checked
+
+        Returns:
+            int: Exit status, 1 if broken links were found (newly broken
+                links with --baseline), else 0
+        """
+        args = self.args
+        print("\nCompleted in: {}".format(time.time() - self.start_time))
+
+        if args.output_errors:
+            self.output_summary(checked_names, errors_total, stop_reason)
+            print("\nError file present at: ", args.output_errors.name)
+        if self.junit_report is not None:
+            self.junit_report.close(stop_reason)
+            self.junit_report = None
+            print("junit-xml report present at: ", JUNIT_REPORT_PATH)
+        if args.record:
+            print("Cassette file present at: ", args.record.name)
+        if args.results:
+            self.broken_links.save(args.results)
+            print("Results file present at: ", args.results)
+        if self.baseline is not None:
+            return 1 if self.output_baseline_diff() else 0
+        return 1 if errors_total else 0
+
+    def output_baseline_diff(self):
+        """Prints the broken links which are newly broken or fixed compared
+        with the baseline (see --baseline), and writes them to the output
+        error file
+
+        Returns:
+            int: Number of newly broken links
+        """
+        args = self.args
+        newly_broken, still_broken, fixed = self.broken_links.diff(
+            self.baseline
+        )
+        summary = (
+            "\nCompared with baseline: {} newly broken, {} still broken,"
+            " {} fixed"
+        ).format(len(newly_broken), len(still_broken), len(fixed))
+        print(summary)
+        output_write(args, summary)
+        for title, pairs, results in (
+            ("Newly broken:", newly_broken, self.broken_links),
+            ("Fixed:", fixed, self.baseline),
+        ):
+            if not pairs:
+                continue
+            if args.log_level <= ERROR:
+                print(title)
+            output_write(args, title)
+            for link, file_url in sorted(pairs):
+                status = results.broken_links[link][file_url]
+                result = "  {:<24}{}\n{}{}".format(
+                    str(status), link, " " * 26, file_url
+                )
+                if args.log_level <= ERROR:
+                    print(result)
+                output_write(args, result)
+        return len(newly_broken)
+
+    def check_html_files(self):
+        """Checks the links of the HTML files matching the --html patterns
+
+        Returns:
+            int: Exit status, 1 if broken links were found, else 0
+        """
+        args = self.args
+        self.start_check("HTML files")
+        errors_total = 0
+        checked_names = []
+        stop_reason = None
+        for path, base_url in get_html_files(args.root_url, args.html):
+            stop_reason = self.get_stop_reason(errors_total)
+            if stop_reason:
+                break
+            with open(path, "rb") as html_file:
+                source_html = html_file.read()
+            caught_errors, _ = self.check_source(path, base_url, source_html)
+            checked_names.append(path)
             errors_total += caught_errors
-            exit_status = 1
-
-    print("\nCompleted in: {}".format(time.time() - START_TIME))
+        return self.write_summaries(checked_names, errors_total, stop_reason)
+
+    def check_url_list(self):
+        """Checks the URLs listed in the --url-list file (or streamed on stdin)
+        as they arrive, and prints each result as soon as its check completes.
+        Reading new URLs stops once the limits set by --max-errors or
+        --deadline are reached.
+
+        Returns:
+            int: Exit status, 1 if broken links were found, else 0
+        """
+        args = self.args
+        self.start_check("URL list")
+        url_file = args.url_list
+        self.broken_links.add_file(url_file.name)
+        seen = set()
+        errors_total = 0
+        checked_total = 0
+        stop_reason = None
+
+        def new_links():
+            for link in read_lines(url_file):
+                if stop_reason or self.get_stop_reason(errors_total):
+                    return
+                if link not in seen:
+                    seen.add(link)
+                    yield link
+
+        for link, status in self.iter_link_status(new_links()):
+            self.memoized_links[link] = status
+            checked_total += 1
+            result = "  {:<24}{}".format(str(status), link)
+            if status in GOOD_RESPONSE:
+                if args.log_level <= INFO:
+                    print(result, flush=True)
+            else:
+                errors_total += 1
+                self.map_links_file(link, url_file.name, status)
+                if args.log_level <= ERROR:
+                    print(result, flush=True)
+                output_write(args, result)
+            stop_reason = self.get_stop_reason(errors_total)
+            if stop_reason:
+                break
+
+        if stop_reason and args.log_level <= WARNING:
+            print(
+                "\nStopped early: {} ({} links checked)".format(
+                    stop_reason, checked_total
+                )
+            )
+        if self.junit_report is not None:
+            self.junit_report.add(
+                url_file.name,
+                time.time() - self.start_time,
+                self.broken_links.get_file_links(url_file.name),
+                errors_total,
+            )
+        return self.write_summaries([url_file.name], errors_total, stop_reason)
+
+    def is_crawlable(self, url):
+        """Checks whether URL is a page of the site to crawl, selected by the
+        --include and --exclude patterns
+
+        Args:
+            url (str): Absolute URL normalized by normalize_page_url
+
+        Returns:
+            bool: True if the page is to be crawled
+        """
+        args = self.args
+        root = urlsplit(args.root_url)
+        analysis = urlsplit(url)
+        if (
+            analysis.scheme not in ("http", "https")
+            or analysis.netloc != root.netloc
+            or not analysis.path.startswith(root.path)
+        ):
+            return False
+        extension = posixpath.splitext(analysis.path)[1].lower()
+        if extension in NOT_CRAWLED_EXTENSIONS:
+            return False
+        if args.include and not any(
+            re.search(pattern, url) for pattern in args.include
+        ):
+            return False
+        if args.exclude and any(
+            re.search(pattern, url) for pattern in args.exclude
+        ):
+            return False
+        return True
+
+    def get_page_source(self, page_url):
+        """Gets content of page to crawl from the local docroot if --local flag
+        is set, else from the site
+
+        Args:
+            page_url (str): URL of the page
+
+        Returns:
+            set: content - Content of the page, or None if it is not an HTML
+                    page that exists
+                 redirect_url - URL the page redirects to or None
+        """
+        if self.args.local:
+            path = get_local_page_path(self.args, page_url)
+            if path is None:
+                return None, None
+            with open(path, "rb") as page:
+                return page.read(), None
+        return request_page(page_url, self.get_session())
+
+    def crawl(self):
+        """Crawls the site breadth-first from the root URL and checks all the
+        links found. Links to pages of the site are followed up to --max-depth
+        links away, external links are only checked (once each).
+
+        Returns:
+            int: Exit status, 1 if broken links were found, else 0
+        """
+        args = self.args
+        self.start_check("Pages")
+        frontier = Frontier()
+        frontier.add(normalize_page_url(args.root_url), 0)
+        errors_total = 0
+        checked_names = []
+        stop_reason = None
+        while frontier:
+            stop_reason = self.get_stop_reason(errors_total)
+            if stop_reason:
+                break
+            page_url, depth = frontier.pop()
+            source_html, redirect_url = self.get_page_source(page_url)
+            if redirect_url:
+                redirect_url = normalize_page_url(redirect_url)
+                if self.is_crawlable(redirect_url):
+                    frontier.add(redirect_url, depth)
+                continue
+            if source_html is None:
+                continue
+            caught_errors, link_results = self.check_source(
+                page_url, page_url, source_html
+            )
+            checked_names.append(page_url)
+            errors_total += caught_errors
+            if args.max_depth is not None and depth >= args.max_depth:
+                continue
+            for link, status in link_results.items():
+                link = normalize_page_url(link)
+                if status in GOOD_RESPONSE and self.is_crawlable(link):
+                    frontier.add(link, depth + 1)
+
+        if stop_reason and args.log_level <= WARNING:
+            print(
+                "\nStopped early: {} ({} pages crawled, {} waiting)".format(
+                    stop_reason, len(checked_names), len(frontier)
+                )
+            )
+        return self.write_summaries(checked_names, errors_total, stop_reason)
+
+    def watch(self, interval=WATCH_INTERVAL, cycles=None):
+        """Checks all local license files, then watches them and checks again
+        only the files which are modified. Links which were already checked
+        are served from the memoized results, so only new links are requested.
+
+        Args:
+            interval (float): Seconds between polls of the license files
+            cycles (int): Number of polls (default: poll until interrupted)
+
+        Returns:
+            int: Exit status of the last check, 1 if broken links were found,
+                else 0
+        """
+        mtimes = get_local_mtimes()
+        exit_status = self.run()
+        print("\nWatching for changes in: {}".format(LICENSE_LOCAL_PATH))
+        while cycles is None or cycles > 0:
+            if cycles is not None:
+                cycles -= 1
+            time.sleep(interval)
+            current_mtimes = get_local_mtimes()
+            for license_name in mtimes.keys() - current_mtimes.keys():
+                self.forget_license(license_name)
+            modified = sorted(
+                name
+                for name, mtime in current_mtimes.items()
+                if mtimes.get(name) != mtime
+                and match_license_file(self.args, self.get_license_file(name))
+            )
+            mtimes = current_mtimes
+            for license_name in modified:
+                started = time.time()
+                self.forget_license(license_name)
+                caught_errors = self.check_license(license_name)
+                print(
+                    "\n{}: {} broken links (checked in {:.3f}s)".format(
+                        license_name, caught_errors, time.time() - started
+                    )
+                )
+            if modified:
+                exit_status = 1 if self.broken_links else 0
+        return exit_status
 
-    if args.output_errors:
-        output_summary(args, license_names, errors_total)
-        print("\nError file present at: ", args.output_errors.name)
-        output_test_summary(errors_total)
 
-    sys.exit(exit_status)
+def main():
+    args = parse_argument(sys.argv[1:])
+    checker = Checker(args)
+    if args.crawl:
+        sys.exit(checker.crawl())
+    if args.html:
+        sys.exit(checker.check_html_files())
+    if args.url_list:
+        sys.exit(checker.check_url_list())
+    if args.watch:
+        sys.exit(checker.watch())
+    sys.exit(checker.run())
 
 
 if __name__ == "__main__":
@@ -1,29 +1,138 @@
 # Standard library
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import urlsplit
+from xml.etree import ElementTree
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
 
 # Third-party
 from bs4 import BeautifulSoup
 import grequests
 import pytest
+import requests
 
 # Local/library specific
 import link_checker
 
 
 @pytest.fixture
-def reset_global():
-    link_checker.MEMOIZED_LINKS = {}
-    link_checker.MAP_BROKEN_LINKS = {}
-    return
+def checker():
+    args = link_checker.parse_argument([])
+    return link_checker.Checker(args)
+
+
+@pytest.fixture
+def http_server():
+    """Local HTTP server refusing HEAD requests on /no-head/ paths, failing
+    the first request on /flaky/ paths with 503 and serving HTML on .html
+    paths
+
+    Yields:
+        set: server URL and list of (method, path) of the requests received
+    """
+    received = []
 
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            received.append(("HEAD", self.path))
+            if self.path.startswith("/no-head/"):
+                status = 405
+            elif self.path.startswith("/flaky/"):
+                status = 503 if received.count(received[-1]) == 1 else 200
+            else:
+                status = 200
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
 
-def test_parse_argument(tmpdir):
+        def do_GET(self):
+            received.append(("GET", self.path))
+            if self.path == "/redirect":
+                self.send_response(301)
+                self.send_header("Location", "/page.html")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 404 if "/missing" in self.path else 200
+            body = b"x" * 1024 * 1024
+            self.send_response(status)
+            if self.path.endswith(".html"):
+                body = b"<a href='/ok'>ok</a>"
+                self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except OSError:
+                # Client closed the connection after a partial read
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", received
+    server.shutdown()
+    server.server_close()
+
+
+def test_startup_imports():
+    # Importing the module must not load the heavy third-party dependencies
+    # (or the standard library network stack) or monkeypatch the interpreter
+    heavy_modules = [
+        "bs4",
+        "email",
+        "gevent",
+        "grequests",
+        "http.client",
+        "junit_xml",
+        "lxml",
+        "requests",
+        "ssl",
+        "urllib.request",
+    ]
+    script = (
+        "import sys, link_checker; link_checker.parse_argument(['--local']);"
+        " print(' '.join(m for m in {} if m in sys.modules))".format(
+            heavy_modules
+        )
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""
+    # -X importtime lines: "import time: self [us] | cumulative | package"
+    import_times = {}
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and fields[1].strip().isdigit():
+            import_times[fields[2].strip()] = int(fields[1])
+    assert import_times["link_checker"] < 100000
+
+
+def test_parse_argument(tmpdir, monkeypatch):
+    # The default output file is created in the working directory
+    monkeypatch.chdir(tmpdir)
     # Test default options
     args = link_checker.parse_argument([])
     assert args.log_level == 30
     assert bool(args.output_errors) is False
     assert args.local is False
     assert args.root_url == "https://creativecommons.org"
+    assert args.retries == 2
     # Test --local
     args = link_checker.parse_argument(["--local"])
     assert args.local is True
@@ -63,11 +172,44 @@ def test_parse_argument(tmpdir):
     )
     assert bool(args.output_errors) is True
     assert args.output_errors.name == output_file.strpath
+    # Test --record and --replay
+    cassette_file = tmpdir.join("cassette.jsonl")
+    args = link_checker.parse_argument(["--record", cassette_file.strpath])
+    assert args.record.name == cassette_file.strpath
+    assert args.replay is None
+    args = link_checker.parse_argument(["--replay", cassette_file.strpath])
+    assert args.replay.name == cassette_file.strpath
+    assert args.record is None
+    with pytest.raises(SystemExit):
+        link_checker.parse_argument(
+            [
+                "--record",
+                cassette_file.strpath,
+                "--replay",
+                cassette_file.strpath,
+            ]
+        )
+
+
+def test_get_github_licenses(monkeypatch):
+    # Listing of the legalcode directory as served by GitHub
+    listing = "".join(
+        f"<a class='js-navigation-open link-gray-dark'>{name}</a>"
+        for name in ["by_3.0.html", "README.md", "by_4.0.html"]
+    )
+    urls = []
 
+    def request_text(page_url):
+        urls.append(page_url)
+        return f"<a class='other'>by_2.0.html</a>{listing}".encode()
 
-def test_get_github_licenses():
+    monkeypatch.setattr(link_checker, "request_text", request_text)
     all_links = link_checker.get_github_licenses()
-    assert len(all_links) > 0
+    assert all_links == ["by_4.0.html", "by_3.0.html"]
+    assert urls == [
+        "https://github.com/creativecommons/creativecommons.org/tree/master"
+        "/docroot/legalcode"
+    ]
 
 
 @pytest.mark.parametrize(
@@ -111,6 +253,92 @@ def test_create_base_link(filename, result):
     assert baseURL == result
 
 
+@pytest.mark.parametrize(
+    "filename, result",
+    [
+        ("by-nc-nd_2.0", ("by-nc-nd", "2.0", None, None)),
+        ("by-nc-nd_4.0_cs", ("by-nc-nd", "4.0", None, "cs")),
+        ("by-nc-nd_3.0_rs_sr-Latn", ("by-nc-nd", "3.0", "rs", "sr-Latn")),
+        ("samplingplus_1.0_br", ("sampling+", "1.0", "br", None)),
+        ("zero_1.0_fi", ("zero", "1.0", None, "fi")),
+    ],
+)
+def test_parse_license_filename(filename, result):
+    assert link_checker.parse_license_filename(filename) == result
+
+
+def test_order_license_names():
+    license_names = [
+        "by_2.0.html",
+        "zero_1.0.html",
+        "sampling_1.0.html",
+        "by_3.0_de.html",
+        "README.md",
+        "by_4.0.html",
+        "by-sa_4.0.html",
+        "by_3.0.html",
+    ]
+    assert link_checker.order_license_names(license_names) == [
+        "zero_1.0.html",
+        "by-sa_4.0.html",
+        "by_4.0.html",
+        "by_3.0.html",
+        "by_3.0_de.html",
+        "by_2.0.html",
+        "sampling_1.0.html",
+    ]
+
+
+def test_get_license_index(local_licenses, tmpdir):
+    tmpdir.join("legalcode", "by-sa_4.0_de.html").write("")
+    tmpdir.join("legalcode", "by-sa_3.0_de.html").write("")
+    args = link_checker.parse_argument(["--local"])
+    checker = link_checker.Checker(args)
+    index = checker.get_license_index()
+    assert [license_file.name for license_file in index] == [
+        "zero_1.0.html",
+        "by-sa_4.0_de.html",
+        "by_4.0.html",
+        "by-sa_3.0_de.html",
+        "by_3.0.html",
+        "by_2.0.html",
+    ]
+    assert index[1] == link_checker.LicenseFile(
+        "by-sa_4.0_de.html",
+        "by-sa",
+        "4.0",
+        None,
+        "de",
+        "https://creativecommons.org/licenses/by-sa/4.0/legalcode.de",
+        os.path.join(link_checker.LICENSE_LOCAL_PATH, "by-sa_4.0_de.html"),
+    )
+    # Filters
+    args = link_checker.parse_argument(
+        ["--local", "--license", "by-sa", "--version", "4.0"]
+    )
+    checker = link_checker.Checker(args)
+    index = checker.get_license_index()
+    assert [license_file.name for license_file in index] == [
+        "by-sa_4.0_de.html"
+    ]
+    args = link_checker.parse_argument(
+        [
+            "--local",
+            "--jurisdiction",
+            "de",
+            "--version",
+            "2.0",
+            "--version",
+            "3.0",
+        ]
+    )
+    checker = link_checker.Checker(args)
+    index = checker.get_license_index()
+    assert [license_file.name for license_file in index] == [
+        "by-sa_3.0_de.html"
+    ]
+
+
 def test_output_write(tmpdir):
     # output_errors is set and written to
     output_file = tmpdir.join("errorlog.txt")
@@ -122,21 +350,18 @@ def test_output_write(tmpdir):
     assert output_file.read() == "Output enabled\n"
 
 
-def test_output_summary(reset_global, tmpdir):
+def test_output_summary(tmpdir):
     # output_errors is set and written to
     output_file = tmpdir.join("errorlog.txt")
     args = link_checker.parse_argument(
         ["--output-errors", output_file.strpath]
     )
-    link_checker.MAP_BROKEN_LINKS = {
-        "https://link1.demo": [
-            "https://file1.url/here",
-            "https://file2.url/goes/here",
-        ],
-        "https://link2.demo": ["https://file4.url/here"],
-    }
+    checker = link_checker.Checker(args)
+    checker.map_links_file("https://link1.demo", "https://file1.url/here")
+    checker.map_links_file("https://link1.demo", "https://file2.url/goes/here")
+    checker.map_links_file("https://link2.demo", "https://file4.url/here")
     all_links = ["some link"] * 5
-    link_checker.output_summary(args, all_links, 3)
+    checker.output_summary(all_links, 3)
     args.output_errors.flush()
     lines = output_file.readlines()
     i = 0
@@ -197,6 +422,64 @@ def test_create_absolute_link(link, result):
     assert res == result
 
 
+def random_url(rng, pieces, max_pieces):
+    return "".join(
+        rng.choice(pieces) for _ in range(rng.randint(0, max_pieces))
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_link_resolver(seed):
+    # Property: the resolver gives the same absolute links as
+    # create_absolute_link, whatever the base URLs, hrefs and memo state
+    rng = random.Random(seed)
+    bases = [
+        scheme
+        + netloc
+        + random_url(rng, ["/", "a", "b", ";p", ".."], 5)
+        + random_url(rng, ["?q", "#f"], 1)
+        for scheme in ["https://", "http://", "HTTPS://", "ftp://", ""]
+        for netloc in ["creativecommons.org", "Demo.url:8080", "u@h", ""]
+    ]
+    href_pieces = [""] + ". .. / // a b ?q #f ;p %20 é mailto: https:".split()
+    href_pieces += [" ", "\t", "HTTP://h", "data:"]
+    resolver = link_checker.LinkResolver(max_memory=500)
+    for _ in range(200):
+        base_url = rng.choice(bases)
+        hrefs = [random_url(rng, href_pieces, 5) for _ in range(20)]
+        hrefs += hrefs[:5]
+        assert resolver.resolve(base_url, hrefs) == [
+            link_checker.create_absolute_link(base_url, urlsplit(href))
+            for href in hrefs
+        ]
+    assert resolver.absolute_links and resolver.relative_links
+
+
+def test_link_resolver_memo():
+    resolver = link_checker.LinkResolver()
+    hrefs = ["../", "/licenses/", "//demo.url", "/licenses/"]
+    links = resolver.resolve(
+        "https://cc.demo/licenses/by/4.0/legalcode", hrefs
+    )
+    assert links == [
+        "https://cc.demo/licenses/by/",
+        "https://cc.demo/licenses/",
+        "https://demo.url",
+        "https://cc.demo/licenses/",
+    ]
+    # Documents of the same directory or host share the memoized links
+    links = resolver.resolve(
+        "https://cc.demo/licenses/by/4.0/legalcode.de", hrefs
+    )
+    assert links[:2] == [
+        "https://cc.demo/licenses/by/",
+        "https://cc.demo/licenses/",
+    ]
+    assert len(resolver.relative_links) == 2
+    resolver.resolve("https://cc.demo/publicdomain/zero/1.0/legalcode", hrefs)
+    assert len(resolver.relative_links) == 3
+
+
 def test_get_scrapable_links():
     args = link_checker.parse_argument([])
     test_file = (
@@ -222,9 +505,48 @@ def test_get_scrapable_links():
     )
 
 
+def test_get_scrapable_links_resources():
+    args = link_checker.parse_argument([])
+    test_file = (
+        "<link rel='stylesheet' href='/includes/style.css'>"
+        "<script src='https://code.jquery.com/jquery.js'></script>"
+        "<script>var inline = true;</script>"
+        "<img src='data:image/png;base64,AAAA'"
+        " srcset='/img/a.png 1x, /img/b.png 2x'>"
+        "<iframe src='//player.demo/video'></iframe>"
+        "<iframe src='about:blank'></iframe>"
+        "<script src='JavaScript:void(0)'></script>"
+        "<video src='blob:https://www.demourl.com/1234'></video>"
+        "<a href='/index'>Relative Link</a>"
+    )
+    soup = BeautifulSoup(test_file, "lxml")
+    test_case = soup.find_all(["a", *link_checker.RESOURCE_ATTRIBUTES])
+    base_url = "https://www.demourl.com/dir1/dir2"
+    valid_anchors, valid_links, _ = link_checker.get_scrapable_links(
+        args, base_url, test_case, None, False
+    )
+    assert valid_links == [
+        "https://www.demourl.com/includes/style.css",
+        "https://code.jquery.com/jquery.js",
+        "https://www.demourl.com/img/a.png",
+        "https://www.demourl.com/img/b.png",
+        "https://player.demo/video",
+        "https://www.demourl.com/index",
+    ]
+    assert [anchor.name for anchor in valid_anchors] == [
+        "link",
+        "script",
+        "img",
+        "img",
+        "iframe",
+        "a",
+    ]
+
+
 def test_exception_handler():
     links_list = [
-        "http://invalid-example.creativecommons.org:81",
+        # Closed port
+        "http://127.0.0.1:1",
         "file://C:/Devil",
     ]
     rs = (grequests.get(link, timeout=3) for link in links_list)
@@ -234,19 +556,396 @@ def test_exception_handler():
     assert response == ["Connection Error", "Invalid Schema"]
 
 
-def test_map_links_file(reset_global):
+def test_load_cassette(tmpdir):
+    cassette_file = tmpdir.join("cassette.jsonl")
+    cassette_file.write(
+        '{"url":"https://link1.demo","method":"HEAD","status":200,'
+        '"elapsed":0.1}\n'
+        "\n"
+        '{"url":"file://link2","method":"HEAD","status":"Invalid Schema",'
+        '"elapsed":0.0}\n'
+    )
+    with open(cassette_file.strpath) as cassette:
+        outcomes = link_checker.load_cassette(cassette)
+    assert outcomes == {
+        "https://link1.demo": (200, 0.1, "HEAD", 1),
+        "file://link2": ("Invalid Schema", 0.0, "HEAD", 1),
+    }
+    # Invalid entries are reported with their line number
+    cassette_file.write('{"url":"https://link1.demo"}\n')
+    with open(cassette_file.strpath) as cassette:
+        with pytest.raises(link_checker.CheckerError) as e:
+            link_checker.load_cassette(cassette)
+    assert str(e.value).endswith("cassette.jsonl:1)")
+
+
+def test_record_outcome(tmpdir):
+    cassette_file = tmpdir.join("cassette.jsonl")
+    args = link_checker.parse_argument(["--record", cassette_file.strpath])
+    link_checker.record_outcome(args, "https://link1.demo", 404, 0.12345)
+    link_checker.record_outcome(
+        args, "file://link2", "Invalid Schema", 0, "GET", 3
+    )
+    args.record.close()
+    with open(cassette_file.strpath) as cassette:
+        outcomes = link_checker.load_cassette(cassette)
+    assert outcomes == {
+        "https://link1.demo": (404, 0.123, "HEAD", 1),
+        "file://link2": ("Invalid Schema", 0, "GET", 3),
+    }
+
+
+def test_check_link_status_replay(tmpdir):
+    cassette_file = tmpdir.join("cassette.jsonl")
+    cassette_file.write(
+        '{"url":"https://link1.demo","method":"HEAD","status":200,'
+        '"elapsed":0.1}\n'
+        '{"url":"file://link2","method":"HEAD","status":"Invalid",'
+        '"elapsed":0}\n'
+    )
+    args = link_checker.parse_argument(["--replay", cassette_file.strpath])
+    checker = link_checker.Checker(args)
+    responses = checker.check_link_status(
+        [
+            "file://link2",
+            "https://link3.demo",
+            "https://link1.demo",
+            "file://link2",
+        ]
+    )
+    assert responses == ["Invalid", "Not Recorded", 200, "Invalid"]
+
+
+def test_check_link_status_get_fallback(checker, http_server):
+    url, received = http_server
+    responses = checker.check_link_status(
+        [f"{url}/ok", f"{url}/no-head/ok", f"{url}/no-head/missing"]
+    )
+    assert responses == [200, 200, 404]
+    assert sorted(received) == [
+        ("GET", "/no-head/missing"),
+        ("GET", "/no-head/ok"),
+        ("HEAD", "/no-head/missing"),
+        ("HEAD", "/no-head/ok"),
+        ("HEAD", "/ok"),
+    ]
+    # The host refusing HEAD requests is now checked directly with GET
+    assert checker.get_hosts == {urlsplit(url).netloc}
+    received.clear()
+    assert checker.check_link_status([f"{url}/no-head/other"]) == [200]
+    assert received == [("GET", "/no-head/other")]
+
+
+class SentRequest:
+    def __init__(self, response=None, exception=None):
+        self.response = response
+        self.exception = exception
+
+
+def connection_error(cause):
+    # Chain the exceptions the way urllib3 and requests do
+    try:
+        try:
+            raise cause
+        except OSError:
+            raise OSError("Failed to establish a new connection")
+    except OSError as e:
+        return requests.exceptions.ConnectionError(e)
+
+
+@pytest.mark.parametrize(
+    "request_, transient",
+    [
+        (SentRequest(response=requests.Response()), False),
+        (SentRequest(exception=requests.exceptions.ConnectTimeout()), True),
+        (SentRequest(exception=requests.exceptions.ReadTimeout()), True),
+        (SentRequest(exception=requests.exceptions.InvalidSchema()), False),
+        (SentRequest(exception=requests.exceptions.SSLError()), False),
+        (SentRequest(exception=requests.exceptions.ProxyError()), False),
+        (
+            SentRequest(exception=connection_error(ConnectionResetError())),
+            True,
+        ),
+        (
+            SentRequest(
+                exception=connection_error(
+                    socket.gaierror(socket.EAI_NONAME, "Name not known")
+                )
+            ),
+            False,
+        ),
+        (
+            SentRequest(
+                exception=connection_error(
+                    socket.gaierror(socket.EAI_AGAIN, "Try again")
+                )
+            ),
+            True,
+        ),
+    ],
+)
+def test_is_transient(request_, transient):
+    if request_.response is not None:
+        for status, transient in [(404, False), (429, True), (503, True)]:
+            request_.response.status_code = status
+            assert link_checker.is_transient(request_) is transient
+    else:
+        assert link_checker.is_transient(request_) is transient
+
+
+def test_check_link_status_retry(checker, http_server, monkeypatch):
+    url, received = http_server
+    monkeypatch.setattr(link_checker, "RETRY_BACKOFF", 0.01)
+    responses = checker.check_link_status([f"{url}/flaky/1", f"{url}/ok"])
+    assert responses == [200, 200]
+    assert received.count(("HEAD", "/flaky/1")) == 2
+    assert checker.link_attempts == {f"{url}/flaky/1": 2}
+    # No retry once the attempts are exhausted
+    checker.args.retries = 0
+    responses = checker.check_link_status([f"{url}/flaky/2"])
+    assert responses == [503]
+    assert received.count(("HEAD", "/flaky/2")) == 1
+
+
+def test_get_retry_delay(monkeypatch):
+    monkeypatch.setattr(link_checker.random, "uniform", lambda a, b: b)
+    assert link_checker.get_retry_delay(1) == link_checker.RETRY_BACKOFF
+    assert link_checker.get_retry_delay(2) == link_checker.RETRY_BACKOFF * 2
+    assert link_checker.get_retry_delay(20) == link_checker.RETRY_MAX_DELAY
+
+
+@pytest.fixture
+def getaddrinfo(monkeypatch):
+    """Resolver knowing only site.demo among the .demo hosts, which counts
+    their lookups
+
+    Returns:
+        list: .demo host names looked up
+    """
+    lookups = []
+    system_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if not host.endswith(".demo"):
+            return system_getaddrinfo(host, port, *args, **kwargs)
+        lookups.append(host)
+        if host == "site.demo":
+            return [
+                (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))
+            ]
+        if host == "busy.demo":
+            raise socket.gaierror(socket.EAI_AGAIN, "Try again")
+        if host == "failing.demo":
+            raise socket.gaierror(socket.EAI_FAIL, "Non-recoverable failure")
+        raise socket.gaierror(socket.EAI_NONAME, "Name not known")
+
+    monkeypatch.setattr(link_checker.socket, "getaddrinfo", getaddrinfo)
+    return lookups
+
+
+def test_dns_cache(getaddrinfo):
+    dns_cache = link_checker.DNSCache()
+    assert dns_cache.resolve("site.demo") == ["127.0.0.1"]
+    assert dns_cache.resolve("site.demo") == ["127.0.0.1"]
+    assert dns_cache.is_unknown("unknown.demo")
+    assert dns_cache.is_unknown("unknown.demo")
+    # Temporary and resolver failures are not cached
+    assert dns_cache.resolve("busy.demo") is None
+    assert dns_cache.resolve("busy.demo") is None
+    assert not dns_cache.is_unknown("failing.demo")
+    assert dns_cache.resolve("failing.demo") is None
+    assert getaddrinfo == [
+        "site.demo",
+        "unknown.demo",
+        "busy.demo",
+        "busy.demo",
+        "failing.demo",
+        "failing.demo",
+    ]
+    assert set(dns_cache.resolve_times) == {"site.demo", "unknown.demo"}
+    # Only the hosts which are not cached (or expired) are resolved again
+    dns_cache.entries["site.demo"] = (["127.0.0.1"], 0)
+    hosts = ["site.demo", "unknown.demo", "site.demo"]
+    assert dns_cache.prewarm(hosts) == ["site.demo"]
+    assert getaddrinfo.count("site.demo") == 2
+
+
+def test_check_link_status_dns(checker, http_server, getaddrinfo):
+    url, received = http_server
+    port = urlsplit(url).port
+    responses = checker.check_link_status(
+        [
+            f"http://site.demo:{port}/ok",
+            "https://unknown.demo/page",
+            f"http://site.demo:{port}/other",
+        ]
+    )
+    # The host names were resolved once, before the checks
+    assert responses == [200, link_checker.UNKNOWN_HOST, 200]
+    assert sorted(getaddrinfo) == ["site.demo", "unknown.demo"]
+    assert received == [("HEAD", "/ok"), ("HEAD", "/other")]
+
+
+def test_check_link_status_dns_proxy(
+    checker, http_server, getaddrinfo, monkeypatch
+):
+    # Links sent through a proxy are resolved by the proxy
+    url, received = http_server
+    monkeypatch.setenv("HTTP_PROXY", url)
+    monkeypatch.setenv("NO_PROXY", "site.demo")
+    port = urlsplit(url).port
+    responses = checker.check_link_status(
+        ["http://unknown.demo/page", f"http://site.demo:{port}/ok"]
+    )
+    assert responses == [200, 200]
+    assert getaddrinfo == ["site.demo"]
+    assert sorted(received) == [
+        ("HEAD", "/ok"),
+        ("HEAD", "http://unknown.demo/page"),
+    ]
+
+
+@pytest.fixture
+def h2_server(tmpdir):
+    """Local HTTPS server speaking HTTP/2, answering 404 on /missing paths
+
+    Returns:
+        set: server URL, list of the connections accepted, list of
+            (method, path) of the requests received, server TLS context (to
+            change the ALPN protocols offered) and client TLS context
+    """
+    pytest.importorskip("h2")
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is required to create a certificate")
+    import h2.config
+    import h2.connection
+    import h2.events
+    import ssl
+
+    cert_file = tmpdir.join("cert.pem").strpath
+    key_file = tmpdir.join("key.pem").strpath
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes"]
+        + ["-days", "1", "-subj", "/CN=127.0.0.1"]
+        + ["-addext", "subjectAltName=IP:127.0.0.1"]
+        + ["-keyout", key_file, "-out", cert_file],
+        check=True,
+        capture_output=True,
+    )
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert_file, key_file)
+    server_context.set_alpn_protocols(["h2"])
+    client_context = ssl.create_default_context(cafile=cert_file)
+    connections = []
+    received = []
+
+    def serve(sock):
+        config = h2.config.H2Configuration(
+            client_side=False, header_encoding="utf-8"
+        )
+        connection = h2.connection.H2Connection(config)
+        connection.initiate_connection()
+        sock.sendall(connection.data_to_send())
+        while True:
+            data = sock.recv(65535)
+            if not data:
+                break
+            for event in connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    headers = dict(event.headers)
+                    path = headers[":path"]
+                    received.append((headers[":method"], path))
+                    status = "404" if path.startswith("/missing") else "200"
+                    connection.send_headers(
+                        event.stream_id, [(":status", status)], end_stream=True
+                    )
+            sock.sendall(connection.data_to_send())
+        sock.close()
+
+    def accept():
+        # The sockets are created and used by this thread, serving each
+        # connection in a greenlet
+        import gevent
+
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(16)
+        ports.append(listener.getsockname()[1])
+        listening.set()
+        while True:
+            sock, _ = listener.accept()
+            connections.append(sock)
+            try:
+                sock = server_context.wrap_socket(sock, server_side=True)
+            except OSError:
+                continue
+            if sock.selected_alpn_protocol() == "h2":
+                gevent.spawn(serve, sock)
+            else:
+                sock.close()
+
+    ports = []
+    listening = threading.Event()
+    threading.Thread(target=accept, daemon=True).start()
+    listening.wait(5)
+    url = "https://127.0.0.1:{}".format(ports[0])
+    return url, connections, received, server_context, client_context
+
+
+def test_fetch_link_status_http2(h2_server):
+    url, connections, received, _, client_context = h2_server
+    http2 = link_checker.HTTP2Transport(ssl_context=client_context)
+    links = [f"{url}/page{i}" for i in range(50)] + [f"{url}/missing?q=1"]
+    outcomes = {
+        link: status
+        for link, status, _, method, _ in link_checker.fetch_link_status(
+            links, http2=http2
+        )
+    }
+    assert outcomes == {
+        **{link: 200 for link in links[:-1]},
+        f"{url}/missing?q=1": 404,
+    }
+    # All the requests were multiplexed on one connection
+    assert len(connections) == 1
+    assert len(received) == 51
+    assert ("HEAD", "/missing?q=1") in received
+
+
+def test_http2_transport_fallback(h2_server):
+    url, connections, received, server_context, client_context = h2_server
+    server_context.set_alpn_protocols(["http/1.1"])
+    http2 = link_checker.HTTP2Transport(ssl_context=client_context)
+    # The server does not negotiate HTTP/2: its links are checked with
+    # HTTP/1.1, without connecting again
+    assert http2.head(f"{url}/page") is None
+    assert http2.head(f"{url}/other") is None
+    assert http2.http1_servers == {("127.0.0.1", urlsplit(url).port)}
+    assert len(connections) == 1
+    assert received == []
+    # Only HTTPS links are sent over HTTP/2
+    assert http2.head("http://127.0.0.1/page") is None
+    # Errors are reported like the ones of requests
+    request = http2.head("https://127.0.0.1:1/page")
+    assert link_checker.exception_handler(request, request.exception) == (
+        "Connection Error"
+    )
+
+
+def test_map_links_file(checker):
     links = ["link1", "link2", "link1"]
     file_urls = ["file1", "file1", "file3"]
     for idx, link in enumerate(links):
         file_url = file_urls[idx]
-        link_checker.map_links_file(link, file_url)
-    assert link_checker.MAP_BROKEN_LINKS == {
+        checker.map_links_file(link, file_url)
+    assert checker.broken_links.get_map() == {
         "link1": ["file1", "file3"],
         "link2": ["file1"],
     }
 
 
-def test_write_response(tmpdir):
+def test_write_response(tmpdir, http_server):
+    url, _ = http_server
     # Set config
     output_file = tmpdir.join("errorlog.txt")
     args = link_checker.parse_argument(
@@ -255,18 +954,18 @@ def test_write_response(tmpdir):
 
     # Text to extract valid_anchors
     text = (
-        "<a href='http://httpbin.org/status/200'>Response 200</a>,"
+        f"<a href='{url}/ok'>Response 200</a>,"
         " <a href='file://link3'>Invalid Scheme</a>,"
-        " <a href='http://httpbin.org/status/400'>Response 400</a>"
+        f" <a href='{url}/missing'>Response 404</a>"
     )
     soup = BeautifulSoup(text, "lxml")
     valid_anchors = soup.find_all("a")
 
     # Setup function params
     all_links = [
-        "http://httpbin.org/status/200",
+        f"{url}/ok",
         "file://link3",
-        "http://httpbin.org/status/400",
+        f"{url}/missing",
     ]
     rs = (grequests.get(link) for link in all_links)
     response = grequests.map(
@@ -276,8 +975,8 @@ def test_write_response(tmpdir):
     license_name = "by-cc-nd_2.0"
 
     # Set output to external file
-    caught_errors = link_checker.write_response(
-        args,
+    checker = link_checker.Checker(args)
+    caught_errors = checker.write_response(
         all_links,
         response,
         base_url,
@@ -300,14 +999,37 @@ def test_write_response(tmpdir):
     i += 1
     assert lines[i] == f'{"":<26}<a href="file://link3">Invalid Scheme</a>\n'
     i += 1
-    assert lines[i] == f'  {"400":<24}http://httpbin.org/status/400\n'
+    assert lines[i] == f'  {"404":<24}{url}/missing\n'
     i += 1
-    assert lines[i] == (
-        f'{"":<26}<a href="http://httpbin.org/status/400">Response 400</a>\n'
+    assert lines[i] == f'{"":<26}<a href="{url}/missing">Response 404</a>\n'
+
+
+def test_write_response_attempts(tmpdir):
+    output_file = tmpdir.join("errorlog.txt")
+    args = link_checker.parse_argument(
+        ["--output-errors", output_file.strpath, "-qq"]
+    )
+    checker = link_checker.Checker(args)
+    checker.link_attempts = {"https://link1.demo": 3}
+    soup = BeautifulSoup("<a href='https://link1.demo'>1</a>", "lxml")
+    caught_errors = checker.write_response(
+        ["https://link1.demo"],
+        ["Timeout Error"],
+        "https://baseurl/goes/here",
+        "by_4.0",
+        soup.find_all("a"),
+        "by_4.0",
+        False,
+    )
+    assert caught_errors == 1
+    args.output_errors.flush()
+    lines = output_file.readlines()
+    assert lines[3] == (
+        f'  {"Timeout Error":<24}https://link1.demo (3 attempts)\n'
     )
 
 
-def test_get_memoized_result(reset_global):
+def test_get_memoized_result(checker):
     text = (
         "<a href='link1'>Link 1</a>,"
         " <a href='link2'>Link 2</a>,"
@@ -317,14 +1039,14 @@ def test_get_memoized_result(reset_global):
     soup = BeautifulSoup(text, "lxml")
     valid_anchors = soup.find_all("a")
     valid_links = ["link1", "link2", "link3_stored", "link4_stored"]
-    link_checker.MEMOIZED_LINKS = {"link3_stored": 200, "link4_stored": 404}
+    checker.memoized_links = {"link3_stored": 200, "link4_stored": 404}
     (
         stored_links,
         stored_anchors,
         stored_result,
         check_links,
         check_anchors,
-    ) = link_checker.get_memoized_result(valid_links, valid_anchors)
+    ) = checker.get_memoized_result(valid_links, valid_anchors)
     assert stored_links == ["link3_stored", "link4_stored"]
     assert str(stored_anchors) == (
         '[<a href="link3_stored">Link3 - stored</a>,'
@@ -338,12 +1060,13 @@ def test_get_memoized_result(reset_global):
     )
 
 
-def test_memoize_result(reset_global):
+def test_memoize_result(checker, http_server):
+    url, _ = http_server
     check_links = [
         # Good response
-        "https://httpbin.org/status/200",
+        f"{url}/ok",
         # Bad response
-        "https://httpbin.org/status/400",
+        f"{url}/missing",
         # Invalid schema - Caught by exception handler
         "file://hh",
     ]
@@ -351,74 +1074,684 @@ def test_memoize_result(reset_global):
     response = grequests.map(
         rs, exception_handler=link_checker.exception_handler
     )
-    link_checker.memoize_result(check_links, response)
-    assert len(link_checker.MEMOIZED_LINKS.keys()) == 3
-    assert (
-        link_checker.MEMOIZED_LINKS[
-            "https://httpbin.org/status/200"
-        ].status_code
-        == 200
+    checker.memoize_result(check_links, response)
+    assert len(checker.memoized_links.keys()) == 3
+    assert checker.memoized_links[f"{url}/ok"].status_code == 200
+    assert checker.memoized_links[f"{url}/missing"].status_code == 404
+    assert checker.memoized_links["file://hh"] == "Invalid Schema"
+
+
+@pytest.mark.parametrize(
+    "listening, error", [(True, "Timeout"), (False, "ConnectionError")]
+)
+def test_request_text(listening, error, monkeypatch):
+    # Server accepting connections without ever answering, or closed port
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    if listening:
+        server.listen()
+    URL = "http://127.0.0.1:{}".format(server.getsockname()[1])
+    monkeypatch.setattr(link_checker, "REQUESTS_TIMEOUT", 0.5)
+    with server, pytest.raises(link_checker.CheckerError) as e:
+        link_checker.request_text(URL)
+    assert str(e.value) == (
+        "(1) FAILED to retreive source HTML ({}) due to {}".format(URL, error)
+    )
+
+
+def test_checker_isolation(tmpdir):
+    # Checkers hold their own state, and can share memoized results when
+    # explicitly asked to
+    args = link_checker.parse_argument([])
+    first = link_checker.Checker(args)
+    second = link_checker.Checker(args)
+    first.memoize_result(["link1"], [200])
+    first.map_links_file("link2", "file1")
+    assert second.memoized_links == {}
+    assert second.broken_links.get_map() == {}
+    shared = link_checker.Checker(args, first.memoized_links)
+    assert shared.get_memoized_result(["link1"], ["anchor1"])[0] == ["link1"]
+
+
+def test_checker_run(tmpdir, monkeypatch):
+    cassette_file = tmpdir.join("cassette.jsonl")
+    cassette_file.write(
+        '{"url":"https://link1.demo","method":"HEAD","status":404,'
+        '"elapsed":0.1}\n'
+    )
+    tmpdir.join("by_4.0.html").write("<a href='https://link1.demo'>Link 1</a>")
+    tmpdir.join("zero_1.0.html").write("<a href='/licenses/'>Licenses</a>")
+    monkeypatch.setattr(link_checker, "LICENSE_LOCAL_PATH", tmpdir.strpath)
+    args = link_checker.parse_argument(
+        ["--local", "--replay", cassette_file.strpath, "-qq"]
+    )
+    checker = link_checker.Checker(args)
+    assert checker.run() == 1
+    assert checker.broken_links.get_map() == {
+        "https://link1.demo": [
+            "https://creativecommons.org/licenses/by/4.0/legalcode"
+        ],
+        "https://creativecommons.org/licenses/": [
+            "https://creativecommons.org/publicdomain/zero/1.0/legalcode"
+        ],
+    }
+    # Broken links are collected again on each run, memoized results are not
+    checker.memoized_links["https://link1.demo"] = 200
+    assert checker.run(["by_4.0.html"]) == 0
+    assert checker.broken_links.get_map() == {}
+
+
+@pytest.fixture
+def local_licenses(tmpdir, monkeypatch):
+    """Local license files with a cassette file to replay their link checks
+
+    Returns:
+        str: Path of the cassette file
+    """
+    cassette_file = tmpdir.join("cassette.jsonl")
+    cassette_file.write(
+        '{"url":"https://broken.demo","method":"HEAD","status":404,'
+        '"elapsed":0.1}\n'
+        '{"url":"https://ok.demo","method":"HEAD","status":200,'
+        '"elapsed":0.1}\n'
+    )
+    licenses = tmpdir.mkdir("legalcode")
+    licenses.join("zero_1.0.html").write("<a href='https://ok.demo'>ok</a>")
+    licenses.join("by_4.0.html").write("<a href='https://ok.demo'>ok</a>")
+    licenses.join("by_3.0.html").write("<a href='https://broken.demo'>x</a>")
+    licenses.join("by_2.0.html").write("<a href='https://broken.demo'>x</a>")
+    monkeypatch.setattr(link_checker, "LICENSE_LOCAL_PATH", licenses.strpath)
+    monkeypatch.chdir(tmpdir)
+    return cassette_file.strpath
+
+
+def test_result_store(tmpdir):
+    results = link_checker.ResultStore()
+    results.add_file("file0")
+    results.add("link1", "file1", 404)
+    results.add("link1", "file2", 404)
+    results.add("link1", "file1", 404)
+    results.add("link2", "file2", "Connection Error")
+    assert len(results) == 2
+    assert results.get_map() == {
+        "link1": ["file1", "file2"],
+        "link2": ["file2"],
+    }
+    assert list(results.files) == ["file0", "file1", "file2"]
+    results_path = tmpdir.join("results.json").strpath
+    results.save(results_path)
+    loaded = link_checker.ResultStore()
+    loaded.load(results_path)
+    assert loaded.files == results.files
+    assert loaded.broken_links == results.broken_links
+    results.remove_file("file2")
+    assert results.get_map() == {"link1": ["file1"]}
+    assert list(results.files) == ["file0", "file1"]
+    # file2 is not checked anymore: its broken links are not fixed
+    results.add("link3", "file0", 500)
+    newly_broken, still_broken, fixed = results.diff(loaded)
+    assert newly_broken == {("link3", "file0")}
+    assert still_broken == {("link1", "file1")}
+    assert fixed == set()
+    results.add_file("file2")
+    newly_broken, still_broken, fixed = results.diff(loaded)
+    assert fixed == {("link1", "file2"), ("link2", "file2")}
+    tmpdir.join("invalid.json").write("{}")
+    with pytest.raises(link_checker.CheckerError):
+        loaded.load(tmpdir.join("invalid.json").strpath)
+    with pytest.raises(link_checker.CheckerError):
+        loaded.load(tmpdir.join("missing.json").strpath)
+
+
+def test_checker_run_baseline(local_licenses, tmpdir, capsys):
+    results_file = tmpdir.join("results.json")
+    args = link_checker.parse_argument(
+        ["--local", "--replay", local_licenses, "-q"]
+        + ["--results", results_file.strpath]
+    )
+    assert link_checker.Checker(args).run() == 1
+    results = json.loads(results_file.read())
+    assert len(results["files"]) == 4
+    assert [entry["status"] for entry in results["broken_links"]] == [404, 404]
+    # The 2.0 license file is newly broken and the broken link of the zero
+    # license file is fixed
+    broken_3_0, broken_2_0 = results["broken_links"]
+    zero = results["files"][0]
+    results["broken_links"] = [
+        broken_3_0,
+        {"url": "https://old.demo", "file": zero, "status": 404},
+    ]
+    baseline_file = tmpdir.join("baseline.json")
+    baseline_file.write(json.dumps(results))
+    args = link_checker.parse_argument(
+        ["--local", "--replay", local_licenses, "-q"]
+        + ["--baseline", baseline_file.strpath]
     )
+    capsys.readouterr()
+    assert link_checker.Checker(args).run() == 1
+    output = capsys.readouterr().out
     assert (
-        link_checker.MEMOIZED_LINKS[
-            "https://httpbin.org/status/400"
-        ].status_code
-        == 400
+        "Compared with baseline: 1 newly broken, 1 still broken, 1 fixed\n"
+        "Newly broken:\n"
+        f'  {"404":<24}https://broken.demo\n{"":<26}{broken_2_0["file"]}\n'
+        "Fixed:\n"
+        f'  {"404":<24}https://old.demo\n{"":<26}{zero}\n'
+    ) in output
+    # Only newly broken links make the check fail
+    results["broken_links"] = [broken_2_0, broken_3_0]
+    baseline_file.write(json.dumps(results))
+    args = link_checker.parse_argument(
+        ["--local", "--replay", local_licenses, "-q"]
+        + ["--baseline", baseline_file.strpath]
+    )
+    assert link_checker.Checker(args).run() == 0
+
+
+def test_checker_run_max_errors(local_licenses, tmpdir):
+    output_file = tmpdir.join("errorlog.txt")
+    args = link_checker.parse_argument(
+        [
+            "--local",
+            "--replay",
+            local_licenses,
+            "--max-errors",
+            "1",
+            "--output-errors",
+            output_file.strpath,
+            "-qq",
+        ]
+    )
+    checker = link_checker.Checker(args)
+    assert checker.run() == 1
+    # zero, 4.0 and 3.0 license files are checked, 2.0 is not
+    assert list(checker.broken_links.get_map()) == ["https://broken.demo"]
+    assert len(checker.broken_links.get_map()["https://broken.demo"]) == 1
+    args.output_errors.flush()
+    summary = output_file.read()
+    assert "Stopped early: 1 broken links found (--max-errors)\n" in summary
+    assert "Total files checked: 3\n" in summary
+    with open("test-summary/junit-xml-report.xml") as test_summary:
+        report = test_summary.read()
+    assert "<system-out>Stopped early: 1 broken links found" in report
+    suite = ElementTree.fromstring(report).find("testsuite")
+    assert suite.get("tests") == "3"
+    assert suite.get("failures") == "1"
+
+
+def test_checker_run_deadline(local_licenses, monkeypatch):
+    args = link_checker.parse_argument(
+        ["--local", "--replay", local_licenses, "--deadline", "10", "-qq"]
+    )
+    checker = link_checker.Checker(args)
+    checked = []
+
+    def check_license(license_name):
+        checked.append(license_name)
+        # Pretend the check took all the time budget
+        checker.start_time -= 10
+        return 0
+
+    monkeypatch.setattr(checker, "check_license", check_license)
+    assert checker.run() == 0
+    assert checked == ["zero_1.0.html"]
+    assert checker.get_stop_reason(0) == "10.0 seconds elapsed (--deadline)"
+
+
+def test_checker_run_history(local_licenses, tmpdir):
+    history_file = tmpdir.join("history.json")
+    args = link_checker.parse_argument(
+        [
+            "--local",
+            "--replay",
+            local_licenses,
+            "--history",
+            history_file.strpath,
+            "-qq",
+        ]
+    )
+    checker = link_checker.Checker(args)
+    assert checker.run() == 1
+    assert link_checker.load_history(history_file.strpath) == {
+        "by_2.0.html": 1,
+        "by_3.0.html": 1,
+    }
+    # License files which had broken links are checked first
+    checker = link_checker.Checker(args)
+    assert checker.prioritize_licenses(link_checker.get_local_licenses()) == [
+        "by_3.0.html",
+        "by_2.0.html",
+        "zero_1.0.html",
+        "by_4.0.html",
+    ]
+
+
+def test_request_page(http_server):
+    url, received = http_server
+    assert link_checker.request_page(f"{url}/page.html") == (
+        b"<a href='/ok'>ok</a>",
+        None,
+    )
+    assert link_checker.request_page(f"{url}/redirect") == (
+        None,
+        f"{url}/page.html",
+    )
+    # Pages which are not HTML are not downloaded
+    assert link_checker.request_page(f"{url}/image") == (None, None)
+    assert link_checker.request_page(f"{url}/missing.html") == (None, None)
+
+
+def test_frontier():
+    frontier = link_checker.Frontier(max_memory=2)
+    assert frontier.add("https://site.demo/", 0) is True
+    assert frontier.add("https://site.demo/", 1) is False
+    for page in range(1, 6):
+        frontier.add(f"https://site.demo/{page}", 1)
+    # Waiting URLs beyond max_memory are spilled to disk
+    assert len(frontier.queue) == 2
+    assert len(frontier) == 6
+    popped = [frontier.pop() for _ in range(4)]
+    frontier.add("https://site.demo/6", 2)
+    frontier.add("https://site.demo/1", 2)
+    while frontier:
+        popped.append(frontier.pop())
+    assert popped == [
+        ("https://site.demo/", 0),
+        ("https://site.demo/1", 1),
+        ("https://site.demo/2", 1),
+        ("https://site.demo/3", 1),
+        ("https://site.demo/4", 1),
+        ("https://site.demo/5", 1),
+        ("https://site.demo/6", 2),
+    ]
+
+
+@pytest.mark.parametrize(
+    "url, result",
+    [
+        ("https://site.demo", "https://site.demo/"),
+        ("https://site.demo/page#section", "https://site.demo/page"),
+        ("https://site.demo/page?q=1", "https://site.demo/page?q=1"),
+    ],
+)
+def test_normalize_page_url(url, result):
+    assert link_checker.normalize_page_url(url) == result
+
+
+def test_is_crawlable():
+    args = link_checker.parse_argument(
+        [
+            "--crawl",
+            "--root-url",
+            "https://site.demo/docs",
+            "--include",
+            "/docs/(en|de)/",
+            "--exclude",
+            "/draft",
+        ]
     )
-    assert link_checker.MEMOIZED_LINKS["file://hh"] == "Invalid Schema"
+    checker = link_checker.Checker(args)
+    assert checker.is_crawlable("https://site.demo/docs/en/page")
+    assert checker.is_crawlable("https://site.demo/docs/de/")
+    assert not checker.is_crawlable("https://site.demo/docs/fr/page")
+    assert not checker.is_crawlable("https://site.demo/docs/en/draft")
+    assert not checker.is_crawlable("https://site.demo/docs/en/doc.pdf")
+    assert not checker.is_crawlable("https://site.demo/blog/en/page")
+    assert not checker.is_crawlable("https://other.demo/docs/en/page")
+    assert not checker.is_crawlable("ftp://site.demo/docs/en/page")
 
 
 @pytest.mark.parametrize(
-    "URL, error",
+    "max_depth, pages",
     [
-        ("https://www.google.com:82", "Timeout"),
-        ("http://doesnotexist.google.com", "ConnectionError"),
+        (
+            None,
+            [
+                "https://creativecommons.org/",
+                "https://creativecommons.org/about/",
+                "https://creativecommons.org/legalcode/by_4.0.html",
+            ],
+        ),
+        ("0", ["https://creativecommons.org/"]),
     ],
 )
-def test_request_text(URL, error):
-    with pytest.raises(link_checker.CheckerError) as e:
-        assert link_checker.request_text(URL)
-        assert str(e.value) == (
-            "FAILED to retreive source HTML (https://www.google.com:82) due"
-            " to {}".format(error)
+def test_checker_crawl(max_depth, pages, tmpdir, monkeypatch):
+    cassette_file = tmpdir.join("cassette.jsonl")
+    cassette_file.write(
+        "".join(
+            f'{{"url":"{url}","method":"HEAD","status":{status},'
+            '"elapsed":0.1}\n'
+            for url, status in [
+                ("https://creativecommons.org/", 200),
+                ("https://creativecommons.org/about/", 200),
+                ("https://creativecommons.org/about/#team", 200),
+                ("https://creativecommons.org/missing", 404),
+                ("https://creativecommons.org/legalcode/by_4.0.html", 200),
+                ("https://external.demo/", 200),
+            ]
         )
+    )
+    docroot = tmpdir.mkdir("docroot")
+    docroot.join("index.html").write(
+        "<a href='/about/#team'>About</a>"
+        "<a href='/missing'>Missing</a>"
+        "<a href='/legalcode/by_4.0.html'>BY 4.0</a>"
+        "<a href='https://external.demo/'>External</a>"
+    )
+    docroot.mkdir("about").join("index.html").write(
+        "<a href='/'>Home</a><a href='https://external.demo/'>External</a>"
+    )
+    docroot.mkdir("legalcode").join("by_4.0.html").write(
+        "<a href='../about/'>About</a>"
+    )
+    monkeypatch.setattr(
+        link_checker, "LICENSE_LOCAL_PATH", docroot.join("legalcode").strpath
+    )
+    arguments = ["--crawl", "--local", "--replay", cassette_file.strpath]
+    if max_depth:
+        arguments += ["--max-depth", max_depth]
+    args = link_checker.parse_argument(arguments + ["-qq"])
+    checker = link_checker.Checker(args)
+    crawled = []
+    check_source = checker.check_source
+
+    def record_page(name, base_url, source_html):
+        crawled.append(name)
+        return check_source(name, base_url, source_html)
+
+    monkeypatch.setattr(checker, "check_source", record_page)
+    assert checker.crawl() == 1
+    assert crawled == pages
+    assert checker.broken_links.get_map() == {
+        "https://creativecommons.org/missing": ["https://creativecommons.org/"]
+    }
+
+
+def test_get_html_files(tmpdir):
+    site = tmpdir.mkdir("site")
+    site.join("index.html").write("")
+    site.mkdir("docs").join("page.html").write("")
+    site.join("docs", "notes.txt").write("")
+    pattern = os.path.join(site.strpath, "**", "*.html")
+    html_files = link_checker.get_html_files("https://site.demo", [pattern])
+    assert html_files == [
+        (
+            os.path.join(site.strpath, "docs", "page.html"),
+            "https://site.demo/docs/page.html",
+        ),
+        (
+            os.path.join(site.strpath, "index.html"),
+            "https://site.demo/index.html",
+        ),
+    ]
+    # Patterns without magic map the file to the root URL
+    pattern = os.path.join(site.strpath, "docs", "page.html")
+    html_files = link_checker.get_html_files("https://site.demo", [pattern])
+    assert html_files == [(pattern, "https://site.demo/page.html")]
+    with pytest.raises(link_checker.CheckerError):
+        link_checker.get_html_files("https://site.demo", ["*.missing"])
+
+
+def test_checker_check_html_files(local_licenses, tmpdir):
+    pattern = os.path.join(tmpdir.strpath, "legalcode", "by_*.html")
+    args = link_checker.parse_argument(
+        ["--html", pattern, "--replay", local_licenses, "-qq"]
+    )
+    checker = link_checker.Checker(args)
+    assert checker.check_html_files() == 1
+    assert checker.broken_links.get_map() == {
+        "https://broken.demo": [
+            "https://creativecommons.org/by_2.0.html",
+            "https://creativecommons.org/by_3.0.html",
+        ]
+    }
+
+
+def test_checker_check_url_list(local_licenses, tmpdir, capsys):
+    url_file = tmpdir.join("urls.txt")
+    url_file.write(
+        "# Links to check\n"
+        "https://broken.demo\n"
+        "\n"
+        "https://ok.demo\n"
+        "https://broken.demo\n"
+    )
+    args = link_checker.parse_argument(
+        ["--url-list", url_file.strpath, "--replay", local_licenses, "-v"]
+    )
+    checker = link_checker.Checker(args)
+    assert checker.check_url_list() == 1
+    assert checker.broken_links.get_map() == {
+        "https://broken.demo": [url_file.strpath]
+    }
+    output = capsys.readouterr().out
+    assert output.startswith(
+        f'  {"404":<24}https://broken.demo\n  {"200":<24}https://ok.demo\n'
+    )
+
+
+def test_checker_check_url_list_max_errors(local_licenses, tmpdir, capsys):
+    url_file = tmpdir.join("urls.txt")
+    url_file.write("https://broken.demo\nhttps://ok.demo\nhttps://b.demo\n")
+    output_file = tmpdir.join("errorlog.txt")
+    args = link_checker.parse_argument(
+        ["--url-list", url_file.strpath, "--replay", local_licenses, "-v"]
+        + ["--max-errors", "1", "--output-errors", output_file.strpath]
+    )
+    checker = link_checker.Checker(args)
+    assert checker.check_url_list() == 1
+    output = capsys.readouterr().out
+    assert "https://ok.demo" not in output
+    assert "https://b.demo" not in output
+    assert (
+        "Stopped early: 1 broken links found (--max-errors) (1 links checked)"
+    ) in output
+    args.output_errors.flush()
+    assert "Stopped early: 1 broken links found" in output_file.read()
 
 
-def test_request_local_text():
+def test_checker_check_url_list_invalid_url(tmpdir, capsys):
+    # A malformed line does not stop the check of the other links
+    url_file = tmpdir.join("urls.txt")
+    url_file.write("http://[bad\nhttp://127.0.0.1:1\n")
+    args = link_checker.parse_argument(
+        ["--url-list", url_file.strpath, "--retries", "0"]
+    )
+    checker = link_checker.Checker(args)
+    assert checker.check_url_list() == 1
+    output = capsys.readouterr().out
+    assert f'  {"Invalid URL":<24}http://[bad\n' in output
+    assert f'  {"Connection Error":<24}http://127.0.0.1:1\n' in output
+
+
+def test_url_list_stdin():
+    # Links streamed on stdin are checked as they arrive
+    url = "http://127.0.0.1:1"
+    checker_process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "link_checker.py"
+            ),
+            "--url-list",
+            "-",
+            "--retries",
+            "0",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    checker_process.stdin.write(f"{url}/first\n")
+    checker_process.stdin.flush()
+    result = f'  {"Connection Error":<24}{url}/first\n'
+    assert checker_process.stdout.readline() == result
+    checker_process.stdin.write(f"{url}/second\n")
+    checker_process.stdin.close()
+    result = f'  {"Connection Error":<24}{url}/second\n'
+    assert checker_process.stdout.readline() == result
+    checker_process.stdout.close()
+    assert checker_process.wait(timeout=30) == 1
+
+
+def test_get_local_mtimes(tmpdir, monkeypatch):
+    monkeypatch.setattr(link_checker, "LICENSE_LOCAL_PATH", tmpdir.strpath)
+    tmpdir.join("by_4.0.html").write("")
+    tmpdir.join("zero_1.0.html").write("")
+    # Editor lock (dangling symbolic link), swap and backup files
+    os.symlink("editor@host.1234", tmpdir.join(".#by_4.0.html").strpath)
+    tmpdir.join(".by_4.0.html.swp").write("")
+    tmpdir.join("by_4.0.html~").write("")
+    assert link_checker.get_local_licenses() == [
+        "zero_1.0.html",
+        "by_4.0.html",
+    ]
+    tmpdir.mkdir("by_3.0.html")
+    assert sorted(link_checker.get_local_mtimes()) == [
+        "by_4.0.html",
+        "zero_1.0.html",
+    ]
+    monkeypatch.setattr(
+        link_checker, "LICENSE_LOCAL_PATH", tmpdir.join("missing").strpath
+    )
+    with pytest.raises(link_checker.CheckerError):
+        link_checker.get_local_mtimes()
+
+
+def test_checker_watch(tmpdir, monkeypatch, capsys):
+    cassette_file = tmpdir.join("cassette.jsonl")
+    cassette_file.write(
+        '{"url":"https://link1.demo","method":"HEAD","status":404,'
+        '"elapsed":0.1}\n'
+        '{"url":"https://link2.demo","method":"HEAD","status":200,'
+        '"elapsed":0.1}\n'
+    )
+    license_file = tmpdir.join("by_4.0.html")
+    license_file.write("<a href='https://link1.demo'>Link 1</a>")
+    tmpdir.join("zero_1.0.html").write("<a href='https://link2.demo'>2</a>")
+    monkeypatch.setattr(link_checker, "LICENSE_LOCAL_PATH", tmpdir.strpath)
+    args = link_checker.parse_argument(
+        ["--local", "--watch", "--replay", cassette_file.strpath, "-qq"]
+    )
+    checker = link_checker.Checker(args)
+
+    def fix_license(interval):
+        license_file.write("<a href='https://link2.demo'>Link 2</a>")
+        os.utime(license_file.strpath, ns=(0, 0))
+
+    monkeypatch.setattr(link_checker.time, "sleep", fix_license)
+    assert checker.watch(cycles=1) == 0
+    assert checker.broken_links.get_map() == {}
+    output = capsys.readouterr().out
+    assert "by_4.0.html: 0 broken links" in output
+    assert "zero_1.0.html" not in output
+    # --watch is only supported for local license files
+    with pytest.raises(SystemExit):
+        link_checker.parse_argument(["--watch"])
+    with pytest.raises(SystemExit):
+        link_checker.parse_argument(["--watch", "--local", "--crawl"])
+    with pytest.raises(SystemExit):
+        link_checker.parse_argument(["--crawl", "--url-list", "-"])
+
+
+def test_request_local_text(tmpdir, monkeypatch):
     random_string = "creativecommons cc-link-checker"
-    with open("test_file.txt", "w") as test_file:
-        test_file.write(random_string)
-        test_file.close
-    # Change local path to current directory
-    link_checker.LICENSE_LOCAL_PATH = "./"
-    assert link_checker.request_local_text("test_file.txt") == random_string
+    tmpdir.join("test_file.txt").write(random_string)
+    # Change local path to the temporary directory
+    monkeypatch.setattr(link_checker, "LICENSE_LOCAL_PATH", tmpdir.strpath)
+    assert link_checker.request_local_text("test_file.txt") == (
+        random_string.encode()
+    )
 
 
-# TODO: Optimize the test using mock
 @pytest.mark.parametrize(
-    "errors_total, map_links",
-    [(3, {"link1": ["file1", "file3"], "link2": ["file1"]}), (0, {})],
+    "source_html",
+    [
+        # Encoding declared by the document
+        (
+            '<meta charset="iso-8859-1">'
+            '<a href="https://é.demo">Licence</a>'
+        ).encode("iso-8859-1"),
+        (
+            '<meta http-equiv="Content-Type" content="text/html;'
+            ' charset=windows-1252"><a href="https://é.demo">Licence</a>'
+        ).encode("windows-1252"),
+        # Byte order mark
+        '<a href="https://é.demo">Licence</a>'.encode("utf-16"),
+        '<a href="https://é.demo">Licence</a>'.encode("utf-8-sig"),
+        # UTF-8, else Windows-1252 when no encoding is declared
+        '<a href="https://é.demo">Licence</a>'.encode(),
+        '<a href="https://é.demo">Licence</a>'.encode("windows-1252"),
+        '<a href="https://é.demo">Licence</a>',
+    ],
 )
-def test_output_test_summary(errors_total, map_links, reset_global, tmpdir):
-    link_checker.MAP_BROKEN_LINKS = map_links
-    link_checker.output_test_summary(errors_total)
-    with open("test-summary/junit-xml-report.xml", "r") as test_summary:
-        if errors_total != 0:
-            test_summary.readline()
-            test_summary.readline()
-            test_summary.readline()
-            test_summary.readline()
-
-            # The following is split up because sometimes message= is first and
-            # sometimes type= is first (ex. local macOS dev versus GitHub
-            # Actions Linux)
-            test_line = test_summary.readline()
-            assert test_line.startswith("\t\t\t<failure")
-            assert 'message="3 broken links found"' in test_line
-            assert 'type="failure"' in test_line
-            assert test_line.endswith(">Number of error links: 3\n")
-
-            assert (
-                test_summary.readline()
-                == "Number of unique broken links: 2</failure>\n"
-            )
+def test_parse_html(source_html):
+    soup = link_checker.parse_html(source_html)
+    assert soup.find("a")["href"] == "https://é.demo"
+
+
+def test_junit_report(tmpdir):
+    report_path = tmpdir.join("test-summary", "junit-xml-report.xml")
+    report = link_checker.JunitReport(report_path.strpath, "License files")
+    # The report is well-formed before and after each testcase
+    suite = ElementTree.parse(report_path.strpath).find("testsuite")
+    assert suite.get("tests") == "0"
+    report.add("by_4.0.html", 1.5, [], 0)
+    report.add(
+        "by-sa_4.0.html",
+        0.25,
+        [("https://broken.demo/<a>", 404), ("https://nohost.demo", "Error")],
+        3,
+    )
+    suite = ElementTree.parse(report_path.strpath).find("testsuite")
+    assert suite.get("tests") == "2"
+    assert suite.get("failures") == "1"
+    assert suite.get("time") == "1.750"
+    testcases = suite.findall("testcase")
+    assert [testcase.get("name") for testcase in testcases] == [
+        "by_4.0.html",
+        "by-sa_4.0.html",
+    ]
+    assert testcases[0].get("classname") == "License files"
+    assert testcases[0].get("time") == "1.500"
+    assert testcases[0].find("failure") is None
+    failure = testcases[1].find("failure")
+    assert failure.get("message") == "3 broken links found"
+    assert failure.text.split("\n")[1:] == [
+        "404                     https://broken.demo/<a>",
+        "Error                   https://nohost.demo",
+    ]
+    report.close("1 broken links found (--max-errors)")
+    suite = ElementTree.parse(report_path.strpath).find("testsuite")
+    assert len(suite.findall("testcase")) == 2
+    assert suite.find("system-out").text == (
+        "Stopped early: 1 broken links found (--max-errors)"
+    )
+
+
+def test_junit_report_flushes(tmpdir):
+    # The report is well-formed after each write to the file, including the
+    # flushes of testcases larger than the write buffer
+    report_path = tmpdir.join("junit-xml-report.xml").strpath
+    report = link_checker.JunitReport(report_path, "License files")
+    flushed = []
+
+    class ReportFile(io.FileIO):
+        def write(self, data):
+            written = super().write(data)
+            with open(report_path, "rb") as report_file:
+                ElementTree.parse(report_file)
+            flushed.append(written)
+            return written
+
+    report.file.close()
+    report.file = io.BufferedWriter(ReportFile(report_path, "r+"))
+    broken_links = [
+        (f"https://broken.demo/{index}", 404) for index in range(500)
+    ]
+    report.add("by_4.0.html", 0.5, [], 0)
+    report.add("by-sa_4.0.html", 0.5, broken_links, 500)
+    report.close("1 broken links found (--max-errors)")
+    assert len(flushed) >= 6
+    suite = ElementTree.parse(report_path).find("testsuite")
+    assert suite.get("tests") == "2"
+    assert len(suite.find("testcase/failure").text.split("\n")) == 501